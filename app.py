@@ -1,18 +1,25 @@
 import streamlit as st
 import os
+import time
 from dotenv import load_dotenv
-from email_marketing_team import run_email_marketing_team
+from email_marketing_team import build_campaign_task, stream_email_marketing_team
+from llm_backends import LLMQuotaError
+from llm_usage import LLMBudgetError
 from email_utils import EmailMarketingUtils
-from auth import login_page, check_auth, login_user
+from auth import login_page, check_auth, login_user, logout_user
 from campaign_manager import (
     save_campaign,
     save_strategy,
     save_approved_email,
-    get_user_campaigns,
-    get_campaign_details,
+    approve_emails,
+    list_user_campaigns,
     update_campaign_status,
     verify_database_connection
 )
+from async_campaign_manager import get_campaign_details_sync
+from campaign_metrics import get_user_campaign_metrics, metrics_table
+from indexes import ensure_indexes
+from scheduler import schedule_campaign
 from datetime import datetime
 
 # Load environment variables
@@ -25,22 +32,57 @@ session_vars = [
     'email_approved', 'current_step', 'progress_message',
     'pending_review', 'approved_emails', 'email_drafts',
     'email_feedback', 'current_campaign_id', 'form_submitted',
-    'current_view', 'last_action', 'authentication_status'
+    'current_view', 'last_action', 'authentication_status',
+    'campaign_results'
 ]
 
 for var in session_vars:
     if var not in st.session_state:
         st.session_state[var] = None if 'id' in var or 'campaign' in var else False
 
+@st.cache_resource
+def index_status():
+    """Process-wide index setup state, shared across reruns and sessions"""
+    return {"ready": False, "retry_at": 0.0}
+
+def init_database():
+    """
+    Create indexes once per server process instead of on every import. A
+    failure is not remembered as success: setup is retried at most once a
+    minute until every collection's indexes exist.
+    """
+    status = index_status()
+    if status["ready"] or time.time() < status["retry_at"]:
+        return
+    try:
+        ensure_indexes()
+        status["ready"] = True
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+        status["retry_at"] = time.time() + 60
+
 # Cache campaign data
-@st.cache_data(ttl=300, experimental_allow_widgets=True)
+@st.cache_data(ttl=300)
 def fetch_campaign_details(campaign_id):
-    return get_campaign_details(campaign_id)
+    return get_campaign_details_sync(campaign_id)
 
-@st.cache_data(ttl=300)
-def fetch_user_campaigns_cached(user_id):
-    """Cached wrapper for getting user campaigns"""
-    return get_user_campaigns(user_id)
+@st.cache_data(ttl=60)
+def fetch_campaign_metrics(user_id):
+    """All of a user's campaign metrics from the daily rollups"""
+    return metrics_table(get_user_campaign_metrics(str(user_id)))
+
+def load_campaign_page():
+    """Append the next page of campaigns to the list kept in session state"""
+    filters = st.session_state.campaign_list_filters
+    page = list_user_campaigns(
+        st.session_state.user_id,
+        page_size=filters["page_size"],
+        cursor=st.session_state.campaign_list_cursor,
+        status=filters["status"],
+        name_prefix=filters["name_prefix"]
+    )
+    st.session_state.campaign_list.extend(page["campaigns"])
+    st.session_state.campaign_list_cursor = page["next_cursor"]
 
 def handle_strategy_approval(campaign_id):
     key = f"strategy_approved_{campaign_id}"
@@ -91,6 +133,8 @@ st.set_page_config(
     layout="wide"
 )
 
+init_database()
+
 # Initialize page
 if 'page' not in st.session_state:
     st.session_state.page = 'login'
@@ -118,6 +162,11 @@ st.title("📧 AI Email Marketing Team")
 # Sidebar navigation
 st.sidebar.title("Navigation")
 page = st.sidebar.radio("Go to", ["New Campaign", "My Campaigns"])
+previous_page = st.session_state.get("current_page")
+st.session_state.current_page = page
+if st.sidebar.button("Logout", key="logout_button"):
+    logout_user()
+    st.rerun()
 
 if page == "New Campaign":
     st.markdown("## Create New Campaign")
@@ -156,6 +205,13 @@ if page == "New Campaign":
     with st.expander("Advanced Options"):
         include_metrics = st.checkbox("Include Success Metrics", True, key="include_metrics_checkbox")
         preview_html = st.checkbox("Generate HTML Preview", False, key="preview_html_checkbox")
+        bypass_cache = st.checkbox("Regenerate (ignore cached AI responses)", False, key="bypass_cache_checkbox")
+        draft_mode = st.radio(
+            "Draft Generation",
+            ["per_email", "batch"],
+            format_func=lambda mode: {"per_email": "One request per email", "batch": "All emails in one request"}[mode],
+            key="draft_mode_radio"
+        )
             
         st.subheader("Content Preferences")
         include_images = st.checkbox("Include Image Placeholders", True, key="include_images_checkbox")
@@ -192,121 +248,197 @@ if page == "New Campaign":
             st.session_state.current_campaign_id = campaign_id
             
             # Create task prompt
-            task = f"""
-            We need to create an email campaign for our new product launch:
-            - Campaign: {campaign_name}
-            - Product: {product_name}
-            - Target audience: {target_audience}
-            - Goal: {campaign_goal}
-            - Timeline: {timeline} weeks
-            - Number of Emails: {num_emails}
-            - Frequency: {frequency}
-            - Email Tone: {email_tone}
-        
-            - Content Preferences:
-              * Maximum Length: {max_email_length} words
-              * Include Images: {include_images}
-              * CTA Style: {cta_style}
-            """
+            task = build_campaign_task(
+                campaign_data,
+                max_email_length=max_email_length,
+                include_images=include_images,
+                cta_style=cta_style
+            )
             
             try:
-                # Run the email marketing team with progress updates
-                results = run_email_marketing_team(task, lambda x: st.write(x))
+                # Stream the strategy and drafts onto the page as they are generated
+                status_placeholder = st.empty()
+                strategy_placeholder = st.empty()
+                drafts_placeholder = st.empty()
+                drafts_box = drafts_placeholder.container()
+                streamed_strategy = ""
+                results = None
+                for event in stream_email_marketing_team(
+                    task, use_cache=not bypass_cache, session_id=st.session_state.user_id,
+                    draft_mode=draft_mode
+                ):
+                    if event["type"] == "progress":
+                        status_placeholder.write(event["message"])
+                    elif event["type"] == "strategy_chunk":
+                        streamed_strategy += event["text"]
+                        strategy_placeholder.markdown(streamed_strategy)
+                    elif event["type"] == "draft":
+                        with drafts_box.expander(f"Email {event['email_number']} (draft)"):
+                            st.write(event["text"])
+                    elif event["type"] == "done":
+                        results = event["results"]
                 
-                # Save strategy
+                # Replace the streamed preview with the review UI below, which
+                # renders from session state so its buttons work on later reruns
+                status_placeholder.empty()
+                strategy_placeholder.empty()
+                drafts_placeholder.empty()
                 save_strategy(campaign_id, results["strategy"])
-                
-                # Display results in tabs
-                tab1, tab2, tab3, tab4 = st.tabs(["Strategy", "Email Drafts", "Preview", "Review & Approve"])
-                
-                with tab1:
-                    st.header("Campaign Strategy")
-                    st.write(results["strategy"])
-                    strategy_approved = st.checkbox("Approve Strategy", key="approve_strategy_checkbox")
-                
-                with tab2:
-                    st.header("Email Drafts")
-                    st.session_state.email_drafts = results["email_drafts"]
-                    for i, email in enumerate(st.session_state.email_drafts, 1):
-                        with st.expander(f"Email {i}"):
-                            st.markdown("### Draft Content")
-                            email_content = st.text_area("Email Content", email, height=300, key=f"email_content_{i}")
-                            
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                feedback = st.text_area(
-                                    "Feedback",
-                                    key=f"feedback_{i}",
-                                    value=st.session_state.email_feedback.get(i, "")
-                                )
-                                if feedback:
-                                    st.session_state.email_feedback[i] = feedback
-                            
-                            with col2:
-                                if i in st.session_state.approved_emails:
-                                    st.success("✅ Approved")
-                                else:
-                                    col_a, col_b = st.columns([3, 1])
-                                    with col_a:
-                                        feedback_extra = st.text_area(
-                                            "Additional Feedback",
-                                            key=f"additional_feedback_{i}",
-                                            value=st.session_state.email_feedback.get(i, "")
-                                        )
-                                    with col_b:
-                                        if st.button(f"Approve Email {i}", key=f"approve_email_{campaign_id}_{i}"):
-                                            st.session_state.approved_emails.append(i)
-                                            if feedback_extra:
-                                                st.session_state.email_feedback[i] = feedback_extra
-                                                
-                                                # Save approved email without triggering refresh
-                                                email_data = {
-                                                    "email_number": i,
-                                                    "subject": email.split('\n')[0],
-                                                    "content": email_content,
-                                                    "feedback": feedback_extra
-                                                }
-                                                save_approved_email(campaign_id, email_data)
-                                                
-                                                # Update session state
-                                                st.session_state[f"email_approved_{campaign_id}_{i}"] = True
-                                                # Prevent refresh
-                                                st.experimental_rerun()
-                
-                with tab3:
-                    st.header("Preview")
-                    if preview_html and results.get("html_preview"):
-                        st.components.v1.html(results["html_preview"], height=600)
-                    else:
-                        st.info("Enable HTML Preview in Advanced Options to see the email preview")
-                
-                with tab4:
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.subheader("Approval Status")
-                        st.write("Approved Emails:", sorted(st.session_state.approved_emails))
-                        st.write(f"Progress: {len(st.session_state.approved_emails)}/{num_emails} emails approved")
-                        
-                    with col2:
-                        st.subheader("Launch Campaign")
-                        if len(st.session_state.approved_emails) == num_emails and strategy_approved:
-                            if st.button("🚀 Launch Campaign", key=f"launch_campaign_{campaign_id}", type="primary"):
-                                update_campaign_status(campaign_id, "launched")
-                                st.balloons()
-                                st.success("Campaign is ready for launch! 🎉")
-                        else:
-                            remaining = num_emails - len(st.session_state.approved_emails)
-                            if not strategy_approved:
-                                st.warning("⚠️ Please approve the strategy")
-                            if remaining > 0:
-                                st.warning(f"⚠️ Please approve {remaining} more email{'s' if remaining > 1 else ''}")
+                st.session_state.campaign_results = results
+                st.session_state.email_drafts = results["email_drafts"]
+                st.session_state.approved_emails = []
+                st.session_state.email_feedback = {}
             
+            except LLMQuotaError:
+                st.error("The AI service is busy right now. Please try generating again in a minute; "
+                         "drafts that were already generated are cached and will not be regenerated.")
+            except LLMBudgetError as e:
+                st.error(f"This campaign would exceed its token budget: {e}")
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
         else:
             st.error("Please fill in all required fields")
 
+    # Review and approval of the last generated campaign
+    results = st.session_state.campaign_results
+    campaign_id = st.session_state.current_campaign_id
+    if results and campaign_id:
+        num_emails = len(results["email_drafts"])
+        if results.get("failed_drafts"):
+            st.warning(f"⚠️ Could not generate email drafts: {results['failed_drafts']}")
+        with st.expander("🧮 Prompt usage"):
+            totals = results["usage"]["totals"]
+            st.write(f"{totals['calls']} calls ({totals['cached_calls']} cached), "
+                     f"~{totals['prompt_tokens']} prompt and ~{totals['response_tokens']} "
+                     f"response tokens, {totals['elapsed_seconds']:.1f}s")
+            st.dataframe(results["usage"]["calls"])
+        
+        # Display results in tabs
+        tab1, tab2, tab3, tab4 = st.tabs(["Strategy", "Email Drafts", "Preview", "Review & Approve"])
+        
+        with tab1:
+            st.header("Campaign Strategy")
+            st.write(results["strategy"])
+            strategy_approved = st.checkbox("Approve Strategy", key=f"approve_strategy_{campaign_id}")
+        
+        with tab2:
+            st.header("Email Drafts")
+            for i, email in enumerate(st.session_state.email_drafts, 1):
+                with st.expander(f"Email {i}"):
+                    st.markdown("### Draft Content")
+                    email_content = st.text_area("Email Content", email, height=300,
+                                                 key=f"email_content_{campaign_id}_{i}")
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        feedback = st.text_area(
+                            "Feedback",
+                            key=f"feedback_{campaign_id}_{i}",
+                            value=st.session_state.email_feedback.get(i, "")
+                        )
+                        if feedback:
+                            st.session_state.email_feedback[i] = feedback
+                    
+                    with col2:
+                        if i in st.session_state.approved_emails:
+                            st.success("✅ Approved")
+                        elif i in results.get("failed_drafts", []):
+                            st.info("Generation failed; generate the campaign again to get this draft")
+                        else:
+                            col_a, col_b = st.columns([3, 1])
+                            with col_a:
+                                feedback_extra = st.text_area(
+                                    "Additional Feedback",
+                                    key=f"additional_feedback_{campaign_id}_{i}",
+                                    value=st.session_state.email_feedback.get(i, "")
+                                )
+                            with col_b:
+                                if st.button(f"Approve Email {i}", key=f"approve_email_{campaign_id}_{i}"):
+                                    if feedback_extra:
+                                        st.session_state.email_feedback[i] = feedback_extra
+                                    save_approved_email(campaign_id, {
+                                        "email_number": i,
+                                        "subject": email_content.split('\n')[0],
+                                        "content": email_content,
+                                        "feedback": feedback_extra
+                                    })
+                                    st.session_state.approved_emails.append(i)
+                                    st.session_state[f"email_approved_{campaign_id}_{i}"] = True
+                                    st.rerun()
+        
+        with tab3:
+            st.header("Preview")
+            if results.get("html_preview"):
+                st.components.v1.html(results["html_preview"], height=600)
+            else:
+                st.info("Enable HTML Preview in Advanced Options to see the email preview")
+        
+        with tab4:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.subheader("Approval Status")
+                st.write("Approved Emails:", sorted(st.session_state.approved_emails))
+                st.write(f"Progress: {len(st.session_state.approved_emails)}/{num_emails} emails approved")
+                
+                if len(st.session_state.approved_emails) < num_emails:
+                    if st.button("✅ Approve All Emails", key=f"approve_all_{campaign_id}"):
+                        # Approve what the user sees in the editors; drafts that
+                        # failed to generate are only placeholders
+                        all_emails = []
+                        for i, email in enumerate(st.session_state.email_drafts, 1):
+                            if i in results.get("failed_drafts", []):
+                                continue
+                            content = st.session_state.get(f"email_content_{campaign_id}_{i}", email)
+                            all_emails.append({
+                                "email_number": i,
+                                "subject": content.split('\n')[0],
+                                "content": content,
+                                "feedback": st.session_state.email_feedback.get(i, "")
+                            })
+                        approval_results = approve_emails(campaign_id, all_emails)
+                        failed = [r["email_number"] for r in approval_results if r["status"] == "error"]
+                        st.session_state.approved_emails = sorted(set(st.session_state.approved_emails) | {
+                            r["email_number"] for r in approval_results if r["status"] != "error"
+                        })
+                        if failed:
+                            st.error(f"Could not approve emails: {failed}")
+                        else:
+                            st.rerun()
+                
+            with col2:
+                st.subheader("Launch Campaign")
+                launched_key = f"launched_{campaign_id}"
+                if st.session_state.get(launched_key):
+                    st.success(st.session_state[launched_key])
+                elif len(st.session_state.approved_emails) == num_emails and strategy_approved:
+                    list_id = st.text_input(
+                        "Subscriber list (leave empty to launch without scheduling sends)",
+                        key=f"launch_list_{campaign_id}"
+                    )
+                    if st.button("🚀 Launch Campaign", key=f"launch_campaign_{campaign_id}", type="primary"):
+                        try:
+                            if list_id:
+                                schedule = schedule_campaign(st.session_state.user_id, campaign_id, list_id)
+                                first, last = schedule["send_times"][0], schedule["send_times"][-1]
+                                st.session_state[launched_key] = (
+                                    f"Campaign launched! 🎉 Scheduled {schedule['jobs']} send batches from "
+                                    f"{first:%Y-%m-%d %H:%M} to {last:%Y-%m-%d %H:%M} UTC"
+                                )
+                            else:
+                                update_campaign_status(campaign_id, "launched")
+                                st.session_state[launched_key] = "Campaign is ready for launch! 🎉"
+                            st.balloons()
+                            st.success(st.session_state[launched_key])
+                        except ValueError as e:
+                            st.error(f"Could not launch campaign: {e}")
+                else:
+                    remaining = num_emails - len(st.session_state.approved_emails)
+                    if not strategy_approved:
+                        st.warning("⚠️ Please approve the strategy")
+                    if remaining > 0:
+                        st.warning(f"⚠️ Please approve {remaining} more email{'s' if remaining > 1 else ''}")
+
 else:  # My Campaigns page
     st.markdown("## My Campaigns")
         
@@ -314,14 +446,46 @@ else:  # My Campaigns page
     st.write("Current user ID:", st.session_state.user_id)
         
     try:
-        # Clear the cache for testing
-        fetch_user_campaigns_cached.clear()
-            
-        # Fetch campaigns
-        user_campaigns = fetch_user_campaigns_cached(st.session_state.user_id)
+        # Filters
+        col_status, col_name, col_size = st.columns(3)
+        with col_status:
+            status_filter = st.selectbox(
+                "Status", ["All", "draft", "launched", "scheduled", "completed", "deleted"], key="campaign_status_filter"
+            )
+        with col_name:
+            name_prefix = st.text_input("Name starts with", "", key="campaign_name_filter")
+        with col_size:
+            page_size = st.selectbox("Per page", [10, 20, 50], index=1, key="campaign_page_size")
+        
+        filters = {
+            "status": None if status_filter == "All" else status_filter,
+            "name_prefix": name_prefix.strip() or None,
+            "page_size": page_size
+        }
+        
+        # Start over on every visit (campaigns may have been created, approved or
+        # launched since) and when the filters change; within a visit keep the
+        # pages already loaded so "Load more" appends
+        if previous_page != page or st.session_state.get("campaign_list_filters") != filters:
+            st.session_state.campaign_list_filters = filters
+            st.session_state.campaign_list = []
+            st.session_state.campaign_list_cursor = None
+            load_campaign_page()
+        
+        user_campaigns = st.session_state.campaign_list
+        
+        with st.expander("📈 Campaign Performance"):
+            campaign_metrics = fetch_campaign_metrics(st.session_state.user_id)
+            if campaign_metrics:
+                names = {str(c['_id']): c.get('campaign_name') for c in user_campaigns}
+                for row in campaign_metrics:
+                    row["key"] = names.get(row["key"], row["key"])
+                st.dataframe(campaign_metrics, use_container_width=True)
+            else:
+                st.info("No engagement data yet.")
             
         # Debug information
-        st.write(f"Found {len(user_campaigns)} campaigns")
+        st.write(f"Showing {len(user_campaigns)} campaigns")
             
         if user_campaigns:
             for campaign in user_campaigns:
@@ -338,7 +502,7 @@ else:  # My Campaigns page
                     with col2:
                         st.write("**Timeline:**", campaign.get('timeline', 'N/A'), "weeks")
                         st.write("**Number of Emails:**", campaign.get('num_emails', 'N/A'))
-                        st.write("**Approved Emails:**", len(campaign.get('emails', [])))
+                        st.write("**Approved Emails:**", campaign.get('approved_count', 0))
                             
                         created_at = campaign.get('created_at')
                         if created_at:
@@ -353,7 +517,7 @@ else:  # My Campaigns page
                         if st.button("View Details", key=f"view_{campaign['_id']}"):
                             st.session_state.current_campaign_id = campaign['_id']
                             st.session_state.current_view = 'campaign_details'
-                            st.experimental_rerun()
+                            st.rerun()
                     
                     with col_b:
                         if st.button("Delete Campaign", key=f"delete_{campaign['_id']}"):
@@ -361,7 +525,15 @@ else:  # My Campaigns page
                             # Example:
                             update_campaign_status(campaign['_id'], "deleted")
                             st.success(f"Campaign '{campaign.get('campaign_name', 'Unnamed')}' deleted successfully.")
-                            st.experimental_rerun()
+                            st.session_state.campaign_list_filters = None
+                            st.rerun()
+            
+            if st.session_state.campaign_list_cursor:
+                if st.button("Load more", key="load_more_campaigns"):
+                    load_campaign_page()
+                    st.rerun()
+        elif filters["status"] or filters["name_prefix"]:
+            st.info("No campaigns match these filters.")
         else:
             # Check the database directly
             from database import campaigns
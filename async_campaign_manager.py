@@ -0,0 +1,185 @@
+"""
+Asyncio data access layer mirroring campaign_manager (and the user queries
+in auth) on the motor driver. Independent reads run concurrently with
+asyncio.gather.
+
+Sync callers such as the Streamlit app use run_sync() or the *_sync
+facade functions, which run coroutines on one background event loop that
+owns the shared motor client.
+"""
+import asyncio
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from campaign_manager import (
+    CAMPAIGN_PAGE_SORT,
+    CAMPAIGN_SUMMARY_FIELDS,
+    _apply_approval_result,
+    _approval_operation,
+    _campaign_document,
+    _campaign_page_query,
+    _campaign_page_result,
+    _initial_approval_results
+)
+from db_config import get_async_database
+
+def _collection(name: str):
+    return get_async_database()[name]
+
+async def save_campaign(user_id: str, campaign_data: dict):
+    """Save a new campaign or update existing one and return its id"""
+    result = await _collection("campaigns").find_one_and_update(
+        {"user_id": user_id, "campaign_name": campaign_data["campaign_name"]},
+        {"$set": _campaign_document(user_id, campaign_data),
+         "$setOnInsert": {"created_at": datetime.utcnow()}},
+        upsert=True,
+        projection={"_id": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return str(result["_id"])
+
+async def save_strategy(campaign_id: str, strategy_text: str):
+    """Save campaign strategy"""
+    result = await _collection("strategies").insert_one({
+        "campaign_id": campaign_id,
+        "strategy_text": strategy_text,
+        "created_at": datetime.utcnow()
+    })
+    return result.inserted_id
+
+async def save_email_drafts(campaign_id: str, email_drafts: list):
+    """Store generated (not yet approved) email drafts on the campaign"""
+    await _collection("campaigns").update_one(
+        {"_id": ObjectId(campaign_id)},
+        {"$set": {"email_drafts": email_drafts, "updated_at": datetime.utcnow()}}
+    )
+
+async def approve_emails(campaign_id: str, emails: list) -> list:
+    """Approve several emails in one bulk write (see campaign_manager.approve_emails)"""
+    if not emails:
+        return []
+    
+    results = _initial_approval_results(emails)
+    pending = list(range(len(emails)))
+    inserted = 0
+    for attempt in range(2):
+        operations = [_approval_operation(campaign_id, emails[i]) for i in pending]
+        try:
+            result = (await _collection("approved_emails").bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        
+        newly_inserted, pending = _apply_approval_result(results, pending, result, attempt)
+        inserted += newly_inserted
+        if not pending:
+            break
+    
+    if inserted:
+        await _collection("campaigns").update_one(
+            {"_id": ObjectId(campaign_id)}, {"$inc": {"approved_count": inserted}}
+        )
+    return results
+
+async def delete_approved_email(campaign_id: str, email_number: int) -> bool:
+    """Remove an approved email and decrement the campaign's approved count"""
+    result = await _collection("approved_emails").delete_one(
+        {"campaign_id": campaign_id, "email_number": email_number}
+    )
+    if result.deleted_count:
+        await _collection("campaigns").update_one(
+            {"_id": ObjectId(campaign_id)}, {"$inc": {"approved_count": -1}}
+        )
+    return result.deleted_count > 0
+
+async def verify_user_campaign_access(user_id: str, campaign_id: str) -> bool:
+    """Verify user has access to campaign"""
+    campaign = await _collection("campaigns").find_one(
+        {"_id": ObjectId(campaign_id), "user_id": user_id}, {"_id": 1}
+    )
+    return campaign is not None
+
+async def list_user_campaigns(user_id: str, page_size: int = 20, cursor: str = None,
+                              status: str = None, name_prefix: str = None) -> dict:
+    """Get one page of a user's campaign summaries (see campaign_manager.list_user_campaigns)"""
+    if not user_id:
+        return {"campaigns": [], "next_cursor": None}
+    
+    query = _campaign_page_query(user_id, cursor, status, name_prefix)
+    page = await (
+        _collection("campaigns").find(query, CAMPAIGN_SUMMARY_FIELDS)
+        .sort(CAMPAIGN_PAGE_SORT)
+        .limit(page_size + 1)
+        .to_list(page_size + 1)
+    )
+    return _campaign_page_result(page, page_size)
+
+async def get_campaign_details(campaign_id: str):
+    """Get campaign, strategy and approved emails with the three reads in parallel"""
+    campaign, strategy, emails = await asyncio.gather(
+        _collection("campaigns").find_one({"_id": ObjectId(campaign_id)}),
+        _collection("strategies").find_one({"campaign_id": campaign_id}),
+        _collection("approved_emails").find({"campaign_id": campaign_id})
+        .sort("email_number", 1).to_list(None)
+    )
+    if not campaign:
+        return None
+    
+    return {
+        "campaign": campaign,
+        "strategy": strategy["strategy_text"] if strategy else None,
+        "approved_emails": emails
+    }
+
+async def update_campaign_status(campaign_id: str, status: str):
+    """Update campaign status"""
+    await _collection("campaigns").update_one(
+        {"_id": ObjectId(campaign_id)},
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+    )
+
+# User queries used by auth
+
+async def find_user_by_email(email: str):
+    """Get a user document by email"""
+    return await _collection("users").find_one({"email": email})
+
+async def insert_user(user: dict):
+    """Insert a new user document"""
+    return (await _collection("users").insert_one(user)).inserted_id
+
+async def update_last_login(user_id, last_login: datetime = None):
+    """Record a user's last login time"""
+    await _collection("users").update_one(
+        {"_id": user_id}, {"$set": {"last_login": last_login or datetime.utcnow()}}
+    )
+
+# Sync facade
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-db-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run_sync(coroutine):
+    """Run a coroutine from this module on the background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+def get_campaign_details_sync(campaign_id: str):
+    """Blocking get_campaign_details that still overlaps its three reads"""
+    return run_sync(get_campaign_details(campaign_id))
+
+def list_user_campaigns_sync(user_id: str, **kwargs) -> dict:
+    """Blocking list_user_campaigns"""
+    return run_sync(list_user_campaigns(user_id, **kwargs))
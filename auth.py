@@ -1,9 +1,14 @@
 import streamlit as st
 from database import users
-from passlib.hash import pbkdf2_sha256
+import password_hashing
+from last_login_writer import LastLoginWriter
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+from collections import OrderedDict
+import atexit
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,6 +18,65 @@ load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+class TokenCache:
+    """
+    Bounded LRU of validated tokens to their decoded payloads.
+
+    Only tokens that passed jwt.decode are stored, and an entry is dropped
+    once its exp passes, so a hit is exactly as valid as a fresh decode.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return dict(payload)
+
+    def put(self, token: str, payload: dict):
+        # Tokens without exp never expire on their own; don't pin them in memory
+        if "exp" not in payload:
+            return
+        with self._lock:
+            self._entries[token] = (dict(payload), float(payload["exp"]))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0,
+                "size": len(self._entries)
+            }
+
+token_cache = TokenCache()
+last_login_writer = LastLoginWriter(users)
+atexit.register(last_login_writer.stop)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -24,9 +88,14 @@ def create_access_token(data: dict):
 def verify_token(token: str):
     if not token:
         return None
+    
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
         
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.put(token, payload)
         return payload
     except JWTError as e:
         print(f"Token verification error: {e}")
@@ -35,11 +104,22 @@ def verify_token(token: str):
         print(f"Unexpected token error: {e}")
         return None
 
+def token_cache_stats() -> dict:
+    """Hit/miss counters of the validated-token cache"""
+    return token_cache.stats()
+
+def logout_user():
+    """Forget the current session's token and clear the session"""
+    token = st.session_state.get("user_token")
+    if token:
+        token_cache.invalidate(token)
+    st.session_state.clear()
+
 def hash_password(password: str):
-    return pbkdf2_sha256.hash(password)
+    return password_hashing.hash_password(password)
 
 def verify_password(password: str, hashed_password: str):
-    return pbkdf2_sha256.verify(password, hashed_password)
+    return password_hashing.verify_password(password, hashed_password)
 
 def register_user(email: str, password: str, name: str):
     if users.find_one({"email": email}):
@@ -60,11 +140,15 @@ def login_user(email: str, password: str):
     if not user or not verify_password(password, user["password"]):
         return False, "Invalid email or password"
     
-    # Update last login time
-    users.update_one(
-        {"_id": user["_id"]},
-        {"$set": {"last_login": datetime.utcnow()}}
-    )
+    # Last login is written in the background, off the login path
+    last_login_writer.record(user["_id"])
+    
+    # Upgrade the hash if the configured cost changed
+    if password_hashing.needs_rehash(user["password"]):
+        users.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"password": hash_password(password)}}
+        )
     
     # Create token with proper encoding
     token_data = {
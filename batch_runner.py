@@ -0,0 +1,192 @@
+"""
+Headless bulk campaign generation.
+
+Reads campaign specs (the fields save_campaign stores) from a CSV or JSONL
+file, generates them with bounded parallelism and persists the results
+through campaign_manager. Completed specs are appended to a progress file
+so an interrupted run can be restarted and will skip them. An optional
+draft_mode column picks per_email or batch draft generation per campaign.
+
+    python batch_runner.py campaigns.csv --user-id <user_id> --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from campaign_manager import save_campaign, save_email_drafts, save_strategy
+from email_marketing_team import DEFAULT_DRAFT_MODE, build_campaign_task, run_email_marketing_team
+
+CAMPAIGN_FIELDS = [
+    "campaign_name", "product_name", "target_audience", "campaign_goal", "timeline",
+    "num_emails", "frequency", "email_tone", "template_style"
+]
+INTEGER_FIELDS = ["timeline", "num_emails"]
+
+def validate_spec(row) -> Dict:
+    """Return the spec with integer fields converted; raises ValueError if it is unusable"""
+    if not isinstance(row, dict):
+        raise ValueError("not an object")
+    missing = [field for field in CAMPAIGN_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {missing}")
+    spec = dict(row)
+    for field in INTEGER_FIELDS:
+        try:
+            spec[field] = int(row[field])
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be an integer, got {row[field]!r}")
+        if spec[field] < 1:
+            raise ValueError(f"{field} must be at least 1, got {spec[field]}")
+    return spec
+
+def read_campaign_specs(path: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Yield (row number, spec, None) for every usable spec in a .csv or .jsonl
+    file and (row number, None, reason) for the rest, so one bad spec never
+    stops the others
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = enumerate(csv.DictReader(f), 2)
+        else:
+            rows = ((number, line) for number, line in enumerate(f, 1) if line.strip())
+        for number, row in rows:
+            try:
+                if isinstance(row, str):
+                    row = json.loads(row)
+                yield number, validate_spec(row), None
+            except ValueError as e:
+                yield number, None, str(e)
+
+def spec_key(user_id: str, spec: Dict) -> str:
+    """Campaigns are unique per user and name, so that pair identifies a spec"""
+    return f"{user_id}:{spec['campaign_name']}"
+
+def load_completed(progress_path: str) -> set:
+    """Return the keys of specs recorded as completed in the progress file"""
+    if not os.path.exists(progress_path):
+        return set()
+    completed = set()
+    with open(progress_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                # A crash can leave a truncated last line
+                continue
+    return completed
+
+def generate_campaign(user_id: str, spec: Dict, max_workers: int, token_budget: int = None) -> Dict:
+    """Generate and persist one campaign, returning its id, latency and LLM usage totals"""
+    started = time.perf_counter()
+    campaign_data = {field: spec[field] for field in CAMPAIGN_FIELDS}
+    campaign_id = save_campaign(user_id, campaign_data)
+    task = build_campaign_task(
+        campaign_data,
+        max_email_length=int(spec.get("max_email_length") or 250),
+        include_images=str(spec.get("include_images", True)).lower() not in ("false", "0", "no"),
+        cta_style=spec.get("cta_style") or "Button"
+    )
+    results = run_email_marketing_team(task, max_workers=max_workers, token_budget=token_budget,
+                                       draft_mode=spec.get("draft_mode") or DEFAULT_DRAFT_MODE)
+    save_strategy(campaign_id, results["strategy"])
+    save_email_drafts(campaign_id, results["email_drafts"])
+    return {
+        "campaign_id": campaign_id,
+        "failed_drafts": results["failed_drafts"],
+        "latency": time.perf_counter() - started,
+        "usage": results["usage"]["totals"]
+    }
+
+def summarize_latencies(latencies: List[float]) -> Dict:
+    """Return p50/p95/max latency in seconds"""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered)
+    }
+
+def run_batch(path: str, user_id: str, workers: int = 4, draft_workers: int = 2,
+              progress_path: str = None, token_budget: int = None) -> Dict:
+    """Generate every spec in path that is not already completed"""
+    progress_path = progress_path or f"{path}.progress.jsonl"
+    completed = load_completed(progress_path)
+    pending = []
+    rejected = []
+    skipped = 0
+    for number, spec, error in read_campaign_specs(path):
+        if error:
+            print(f"Skipping invalid campaign spec on line {number}: {error}")
+            rejected.append({"line": number, "error": error})
+        elif spec_key(user_id, spec) in completed:
+            skipped += 1
+        else:
+            pending.append(spec)
+    print(f"{skipped} campaigns already completed, {len(rejected)} invalid, {len(pending)} to generate")
+
+    latencies = []
+    prompt_tokens = []
+    failures = []
+    started = time.perf_counter()
+    with open(progress_path, "a", encoding="utf-8") as progress, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(generate_campaign, user_id, spec, draft_workers, token_budget): spec
+            for spec in pending
+        }
+        for future in as_completed(futures):
+            spec = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Campaign {spec['campaign_name']!r} failed: {e}")
+                failures.append(spec["campaign_name"])
+                continue
+            progress.write(json.dumps({"key": spec_key(user_id, spec), **result}) + "\n")
+            progress.flush()
+            os.fsync(progress.fileno())
+            latencies.append(result["latency"])
+            prompt_tokens.append(result["usage"]["prompt_tokens"])
+            print(f"Generated {spec['campaign_name']!r} in {result['latency']:.2f}s "
+                  f"({len(latencies)}/{len(pending)})")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "generated": len(latencies),
+        "failed": failures,
+        "rejected": rejected,
+        "skipped": skipped,
+        "elapsed_seconds": elapsed,
+        "campaigns_per_minute": len(latencies) / elapsed * 60 if elapsed else 0,
+        "latency_seconds": summarize_latencies(latencies),
+        "prompt_tokens": sum(prompt_tokens),
+        "prompt_tokens_per_campaign": statistics.fmean(prompt_tokens) if prompt_tokens else 0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate campaigns in bulk from CSV or JSONL")
+    parser.add_argument("path", help="Campaign specs (.csv or .jsonl)")
+    parser.add_argument("--user-id", required=True, help="Owner of the generated campaigns")
+    parser.add_argument("--workers", type=int, default=4, help="Campaigns generated in parallel")
+    parser.add_argument("--draft-workers", type=int, default=2,
+                        help="Concurrent draft calls within each campaign")
+    parser.add_argument("--progress-file", help="Resume file (default: <path>.progress.jsonl)")
+    parser.add_argument("--token-budget", type=int,
+                        help="Estimated token cap per campaign (default: LLM_CAMPAIGN_TOKEN_BUDGET)")
+    args = parser.parse_args()
+
+    summary = run_batch(args.path, args.user_id, args.workers, args.draft_workers, args.progress_file,
+                        args.token_budget)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
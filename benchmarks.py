@@ -0,0 +1,368 @@
+"""
+Performance benchmarks. Database benchmarks run against MONGODB_URI and
+should be pointed at a local mongod; the data they create is removed.
+
+    python benchmarks.py campaign-details --emails 10 --iterations 200
+    python benchmarks.py login --users 200 --concurrency 16
+    python benchmarks.py segment --rows 100000 1000000 10000000
+    python benchmarks.py tracking --clients 16 --requests 2000
+    python benchmarks.py templates --recipients 200000
+    python benchmarks.py send --messages 5000 --pool-sizes 1 4 16
+    python benchmarks.py drafts --emails 3 5 10 --malformed-rate 0.1
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+def report(name: str, latencies: list, elapsed: float = None):
+    """Print mean/p50/p99 latency in milliseconds and throughput"""
+    ordered = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    print(
+        f"{name:40} n={len(ordered):7} "
+        f"mean={statistics.fmean(ordered) * 1000:8.3f}ms "
+        f"p50={ordered[len(ordered) // 2] * 1000:8.3f}ms "
+        f"p99={ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000:8.3f}ms "
+        f"throughput={len(ordered) / elapsed:10.1f}/s"
+    )
+
+def bench_campaign_details(args):
+    """Sync vs async get_campaign_details, sequential and with concurrent callers"""
+    import async_campaign_manager
+    import campaign_manager
+    from database import approved_emails, campaigns, strategies
+
+    user_id = "benchmark-user"
+    campaign_id = campaign_manager.save_campaign(user_id, {
+        "campaign_name": f"benchmark-{datetime.utcnow().isoformat()}",
+        "product_name": "Benchmark", "target_audience": "Everyone", "campaign_goal": "Speed",
+        "timeline": 4, "num_emails": args.emails, "frequency": "Weekly",
+        "email_tone": "Professional", "template_style": "Minimalist"
+    })
+    campaign_manager.save_strategy(campaign_id, "Benchmark strategy " * 200)
+    campaign_manager.approve_emails(campaign_id, [
+        {"email_number": i, "subject": f"Subject {i}", "content": "Body " * 300}
+        for i in range(1, args.emails + 1)
+    ])
+
+    try:
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            call_started = time.perf_counter()
+            campaign_manager.get_campaign_details(campaign_id)
+            latencies.append(time.perf_counter() - call_started)
+        report("sync get_campaign_details", latencies, time.perf_counter() - started)
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            call_started = time.perf_counter()
+            async_campaign_manager.get_campaign_details_sync(campaign_id)
+            latencies.append(time.perf_counter() - call_started)
+        report("async facade get_campaign_details", latencies, time.perf_counter() - started)
+
+        async def timed():
+            call_started = time.perf_counter()
+            await async_campaign_manager.get_campaign_details(campaign_id)
+            return time.perf_counter() - call_started
+
+        async def concurrent():
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(timed() for _ in range(args.iterations)))
+            return latencies, time.perf_counter() - started
+
+        latencies, elapsed = async_campaign_manager.run_sync(concurrent())
+        report(f"async gather x{args.iterations}", latencies, elapsed)
+    finally:
+        campaigns.delete_many({"user_id": user_id})
+        strategies.delete_many({"campaign_id": campaign_id})
+        approved_emails.delete_many({"campaign_id": campaign_id})
+
+def bench_login(args):
+    """Concurrent login_user calls against seeded users"""
+    import auth
+    import password_hashing
+    from database import users
+
+    domain = "login-benchmark.invalid"
+    password = "benchmark-password"
+    hashed = password_hashing.hash_password(password)
+    users.insert_many([
+        {"email": f"user{i}@{domain}", "password": hashed, "name": f"User {i}",
+         "created_at": datetime.utcnow()}
+        for i in range(args.users)
+    ])
+
+    def timed_login(i):
+        started = time.perf_counter()
+        success, _ = auth.login_user(f"user{i % args.users}@{domain}", password)
+        assert success
+        return time.perf_counter() - started
+
+    try:
+        # Warm up the worker processes and connection pool
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(timed_login, range(args.concurrency)))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(timed_login, range(args.logins)))
+        report(f"login x{args.concurrency} concurrent "
+               f"({password_hashing.PASSWORD_HASH_WORKERS} hash workers)",
+               latencies, time.perf_counter() - started)
+    finally:
+        users.delete_many({"email": {"$regex": f"@{domain}$"}})
+        password_hashing.shutdown()
+
+def bench_segment(args):
+    """Columnar segmentation at several list sizes, against the list-of-dicts scan"""
+    import numpy as np
+    from segmentation import Eq, In, Range, SubscriberStore
+
+    countries = np.array(["US", "DE", "FR", "GB", "IN", "BR", "JP", "CA", "AU", "ES"])
+    plans = np.array(["free", "basic", "pro", "enterprise"])
+    predicates = {
+        "eq": Eq("country", "DE"),
+        "in+range": In("country", ["DE", "FR", "ES"]) & Range("age", 25, 34),
+        "or+not": (Eq("plan", "pro") | Range("score", 0.9, None)) & ~Eq("country", "US"),
+    }
+    for rows in args.rows:
+        rng = np.random.default_rng(0)
+        columns = {
+            "country": countries[rng.integers(0, len(countries), rows)],
+            "plan": plans[rng.integers(0, len(plans), rows)],
+            "age": rng.integers(18, 80, rows, dtype=np.int32),
+            "score": rng.random(rows),
+        }
+        started = time.perf_counter()
+        store = SubscriberStore.from_columns(columns)
+        print(f"rows={rows:>10}  build {time.perf_counter() - started:8.3f}s")
+
+        for name, predicate in predicates.items():
+            store.select(predicate)  # build the bitmaps this predicate uses
+            latencies = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                matches = store.select(predicate)
+                latencies.append(time.perf_counter() - started)
+            report(f"  {name} ({len(matches)} matches)", latencies)
+
+        if rows <= args.legacy_max_rows:
+            records = [
+                {"country": country, "plan": plan}
+                for country, plan in zip(columns["country"].tolist(), columns["plan"].tolist())
+            ]
+            criteria = {"country": "DE", "plan": "pro"}
+            started = time.perf_counter()
+            # The loop segment_audience used before the columnar engine
+            legacy = [r for r in records if all(r.get(k) == v for k, v in criteria.items())]
+            legacy_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            columnar = store.select(Eq("country", "DE") & Eq("plan", "pro"))
+            print(f"  list scan {legacy_seconds * 1000:9.1f}ms vs columnar "
+                  f"{(time.perf_counter() - started) * 1000:9.3f}ms "
+                  f"({len(legacy)} == {len(columnar)} matches)")
+
+def bench_tracking(args):
+    """Load-generate open/click traffic against the tracking endpoint"""
+    import http.client
+    import threading
+    from urllib.parse import urlparse
+    import tracking
+    from database import campaign_stats_daily, engagement_hourly
+
+    user_id = "benchmark-user"
+    campaign_ids = [f"benchmark-campaign-{i}" for i in range(args.campaigns)]
+    buffer = tracking.EventBuffer(engagement_hourly, campaign_stats_daily)
+    server = tracking.make_tracking_server(port=0, buffer=buffer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    tracking.TRACKING_BASE_URL = f"http://{host}:{port}"
+
+    def client(worker):
+        connection = http.client.HTTPConnection(host, port)
+        latencies = []
+        for i in range(args.requests):
+            token = tracking.make_tracking_token(user_id, campaign_ids[(worker + i) % len(campaign_ids)], i % 5 + 1)
+            url = tracking.open_pixel_url(token) if i % 4 else tracking.click_url(token, "https://example.com/")
+            parsed = urlparse(url)
+            started = time.perf_counter()
+            connection.request("GET", f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path)
+            connection.getresponse().read()
+            latencies.append(time.perf_counter() - started)
+        connection.close()
+        return latencies
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            latencies = [latency for result in executor.map(client, range(args.clients)) for latency in result]
+        elapsed = time.perf_counter() - started
+        buffer.stop()
+        report(f"tracking x{args.clients} clients", latencies, elapsed)
+        documents = engagement_hourly.count_documents({"campaign_id": {"$in": campaign_ids}})
+        print(f"{buffer.stats['events']} events -> {buffer.stats['flushes']} flushes, "
+              f"{documents} hourly documents, {buffer.stats['hourly_writes']} bucket upserts")
+    finally:
+        server.shutdown()
+        engagement_hourly.delete_many({"campaign_id": {"$in": campaign_ids}})
+        campaign_stats_daily.delete_many({"campaign_id": {"$in": campaign_ids}})
+
+def bench_templates(args):
+    """Personalized renders per second on one core"""
+    from email_utils import EMAIL_TEMPLATE, EMAIL_TEMPLATE_DEFAULTS
+    from templates import compile_template
+
+    layout = EMAIL_TEMPLATE.replace(
+        "<h1>{{ headline }}</h1>",
+        "<h1>{{ headline }}</h1><p>Hi {{ name }}, news for {{ segment.city }} ({{ segment.plan }})</p>"
+    )
+    recipients = [
+        {"name": f"Subscriber {i}", "segment": {"city": "Berlin", "plan": "pro"},
+         "cta_link": f"https://example.com/c/{i}?r={i}"}
+        for i in range(args.recipients)
+    ]
+    shared = {"subject": "Spring launch", "headline": "It's here", "body": "<p>" + "Body copy. " * 40 + "</p>"}
+
+    compiled = compile_template(layout)
+    started = time.perf_counter()
+    rendered = 0
+    for _ in compiled.render_batch(recipients, shared, EMAIL_TEMPLATE_DEFAULTS):
+        rendered += 1
+    elapsed = time.perf_counter() - started
+    print(f"{rendered} personalized renders in {elapsed:.3f}s = {rendered / elapsed:,.0f} renders/s")
+
+def bench_send(args):
+    """Messages per second through the SMTP pool against a local aiosmtpd server"""
+    import socket
+    import threading
+    from aiosmtpd.controller import Controller
+    import send_engine
+    import tracking
+    from database import campaign_stats_daily, engagement_hourly, send_results
+
+    class CountingHandler:
+        def __init__(self):
+            self.messages = 0
+            self.lock = threading.Lock()
+
+        async def handle_DATA(self, server, session, envelope):
+            with self.lock:
+                self.messages += 1
+            return "250 OK"
+
+    user_id = "benchmark-user"
+    campaign_id = f"benchmark-send-{datetime.utcnow().isoformat()}"
+    email = {"subject": "Subject: Spring launch", "content": "Hello,\n\n" + "Body copy. " * 40 + "\n\nCTA: Shop now"}
+    recipients = [{"email": f"subscriber{i}@example.com"} for i in range(args.messages)]
+    # aiosmtpd's readiness check cannot connect to port 0, so reserve a free port first
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        host, port = probe.getsockname()
+    handler = CountingHandler()
+    controller = Controller(handler, hostname=host, port=port)
+    controller.start()
+    buffer = tracking.EventBuffer(engagement_hourly, campaign_stats_daily)
+    try:
+        for size in args.pool_sizes:
+            pool = send_engine.SMTPConnectionPool(host, port, size=size,
+                                                  messages_per_connection=args.messages_per_connection)
+            engine = send_engine.SendEngine(pool, results_collection=send_results, event_buffer=buffer)
+            summary = engine.send_email(user_id, campaign_id, 1, email, recipients)
+            pool.close()
+            print(f"pool={size:3} sent={summary['sent']:7} failed={summary['failed']:5} "
+                  f"{summary['sent'] / summary['elapsed_seconds']:10.1f} msg/s "
+                  f"connections={pool.stats['connections_opened']}")
+        buffer.stop()
+        print(f"server received {handler.messages} messages")
+    finally:
+        controller.stop()
+        send_results.delete_many({"campaign_id": campaign_id})
+        engagement_hourly.delete_many({"campaign_id": campaign_id})
+        campaign_stats_daily.delete_many({"campaign_id": campaign_id})
+
+def bench_drafts(args):
+    """Per-email vs batched draft generation: wall time, calls and tokens with the offline stub"""
+    from email_marketing_team import build_campaign_task, run_email_marketing_team
+    from llm_backends import StubBackend
+
+    for num_emails in args.emails:
+        task = build_campaign_task({
+            "campaign_name": "Benchmark", "product_name": "Benchmark", "target_audience": "Everyone",
+            "campaign_goal": "Speed", "timeline": 4, "num_emails": num_emails, "frequency": "Weekly",
+            "email_tone": "Neutral"
+        })
+        for mode in ("per_email", "batch"):
+            latencies, totals, repaired = [], [], 0
+            for iteration in range(args.iterations):
+                backend = StubBackend(latency_seconds=args.latency, seconds_per_token=args.seconds_per_token,
+                                      malformed_rate=args.malformed_rate, seed=iteration)
+                started = time.perf_counter()
+                results = run_email_marketing_team(task, max_workers=args.workers, use_cache=False,
+                                                   backend=backend, draft_mode=mode)
+                latencies.append(time.perf_counter() - started)
+                totals.append(results["usage"]["totals"])
+                repaired += len(results["repaired_drafts"])
+            report(f"drafts {mode} x{num_emails} emails", latencies)
+            print(f"{'':40} calls={statistics.fmean(t['calls'] for t in totals):5.1f} "
+                  f"prompt_tokens={statistics.fmean(t['prompt_tokens'] for t in totals):8.1f} "
+                  f"response_tokens={statistics.fmean(t['response_tokens'] for t in totals):8.1f} "
+                  f"repaired={repaired / args.iterations:4.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    details = commands.add_parser("campaign-details", help="Sync vs async campaign detail reads")
+    details.add_argument("--emails", type=int, default=10)
+    details.add_argument("--iterations", type=int, default=200)
+    details.set_defaults(run=bench_campaign_details)
+
+    login = commands.add_parser("login", help="Login throughput and latency")
+    login.add_argument("--users", type=int, default=200)
+    login.add_argument("--logins", type=int, default=1000)
+    login.add_argument("--concurrency", type=int, default=16)
+    login.set_defaults(run=bench_login)
+
+    segment = commands.add_parser("segment", help="Columnar audience segmentation")
+    segment.add_argument("--rows", type=int, nargs="+", default=[10 ** 5, 10 ** 6, 10 ** 7])
+    segment.add_argument("--iterations", type=int, default=20)
+    segment.add_argument("--legacy-max-rows", type=int, default=10 ** 6,
+                         help="Largest size also timed with the list-of-dicts scan")
+    segment.set_defaults(run=bench_segment)
+
+    tracking = commands.add_parser("tracking", help="Tracking endpoint load generator")
+    tracking.add_argument("--clients", type=int, default=16)
+    tracking.add_argument("--requests", type=int, default=2000, help="Requests per client")
+    tracking.add_argument("--campaigns", type=int, default=20)
+    tracking.set_defaults(run=bench_tracking)
+
+    templates = commands.add_parser("templates", help="Compiled template render throughput")
+    templates.add_argument("--recipients", type=int, default=200000)
+    templates.set_defaults(run=bench_templates)
+
+    send = commands.add_parser("send", help="SMTP send pipeline against a local test server")
+    send.add_argument("--messages", type=int, default=5000)
+    send.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 4, 16])
+    send.add_argument("--messages-per-connection", type=int, default=100)
+    send.set_defaults(run=bench_send)
+
+    drafts = commands.add_parser("drafts", help="Per-email vs batched draft generation with the offline stub")
+    drafts.add_argument("--emails", type=int, nargs="+", default=[3, 5, 10])
+    drafts.add_argument("--iterations", type=int, default=5)
+    drafts.add_argument("--workers", type=int, default=4, help="Concurrent per-email draft calls")
+    drafts.add_argument("--latency", type=float, default=0.5, help="Stub seconds per call")
+    drafts.add_argument("--seconds-per-token", type=float, default=0.005, help="Stub decode time per response token")
+    drafts.add_argument("--malformed-rate", type=float, default=0.1,
+                        help="Probability a batched item comes back invalid")
+    drafts.set_defaults(run=bench_drafts)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
+import base64
+import json
+import re
 from database import campaigns, approved_emails, strategies
+from db_config import check_connection
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
-def save_campaign(user_id: str, campaign_data: dict):
-    """Save a new campaign or update existing one"""
-    campaign = {
+def _campaign_document(user_id: str, campaign_data: dict) -> dict:
+    """Fields written by save_campaign"""
+    return {
         "user_id": user_id,
         "campaign_name": campaign_data["campaign_name"],
         "product_name": campaign_data["product_name"],
@@ -16,17 +22,23 @@ def save_campaign(user_id: str, campaign_data: dict):
         "email_tone": campaign_data["email_tone"],
         "template_style": campaign_data["template_style"],
         "status": "draft",
-        "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
+
+def save_campaign(user_id: str, campaign_data: dict):
+    """Save a new campaign or update existing one and return its id"""
+    campaign = _campaign_document(user_id, campaign_data)
     
-    result = campaigns.update_one(
+    # created_at is only set on insert so re-saving keeps the listing order stable
+    result = campaigns.find_one_and_update(
         {"user_id": user_id, "campaign_name": campaign_data["campaign_name"]},
-        {"$set": campaign},
-        upsert=True
+        {"$set": campaign, "$setOnInsert": {"created_at": datetime.utcnow()}},
+        upsert=True,
+        projection={"_id": 1},
+        return_document=ReturnDocument.AFTER
     )
     
-    return str(result.upserted_id) if result.upserted_id else None
+    return str(result["_id"])
 
 def save_strategy(campaign_id: str, strategy_text: str):
     """Save campaign strategy"""
@@ -37,17 +49,95 @@ def save_strategy(campaign_id: str, strategy_text: str):
     }
     return strategies.insert_one(strategy).inserted_id
 
+def save_email_drafts(campaign_id: str, email_drafts: list):
+    """Store generated (not yet approved) email drafts on the campaign"""
+    campaigns.update_one(
+        {"_id": ObjectId(campaign_id)},
+        {"$set": {"email_drafts": email_drafts, "updated_at": datetime.utcnow()}}
+    )
+
+def _approval_operation(campaign_id: str, email_data: dict) -> UpdateOne:
+    """Upsert keyed on (campaign_id, email_number) so repeated approvals are idempotent"""
+    return UpdateOne(
+        {"campaign_id": campaign_id, "email_number": email_data["email_number"]},
+        {"$set": {
+            "subject": email_data["subject"],
+            "content": email_data["content"],
+            "feedback": email_data.get("feedback", ""),
+            "approved_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+def _initial_approval_results(emails: list) -> list:
+    return [
+        {"email_number": email_data["email_number"], "status": "updated", "_id": None}
+        for email_data in emails
+    ]
+
+def _apply_approval_result(results: list, pending: list, result: dict, attempt: int):
+    """Record a bulk_write result; returns (inserted count, indexes to retry)"""
+    inserted = 0
+    for upserted in result.get("upserted", []):
+        item = results[pending[upserted["index"]]]
+        item["status"] = "inserted"
+        item["_id"] = upserted["_id"]
+        inserted += 1
+    
+    retry = []
+    for error in result.get("writeErrors", []):
+        index = pending[error["index"]]
+        if error["code"] == 11000 and attempt == 0:
+            retry.append(index)
+        else:
+            results[index].update({"status": "error", "error": error["errmsg"]})
+    return inserted, retry
+
+def approve_emails(campaign_id: str, emails: list) -> list:
+    """
+    Approve several emails of a campaign in one bulk write.
+
+    Returns one result per email, in order: {"email_number", "status", "_id"}
+    where status is "inserted", "updated" or "error" (with "error" text).
+    The campaign's approved_count grows by the number of inserted emails.
+    """
+    if not emails:
+        return []
+    
+    results = _initial_approval_results(emails)
+    pending = list(range(len(emails)))
+    inserted = 0
+    # Two concurrent upserts of the same email can race on the unique index;
+    # the loser is retried once and then matches the winner's document.
+    for attempt in range(2):
+        operations = [_approval_operation(campaign_id, emails[i]) for i in pending]
+        try:
+            result = approved_emails.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        
+        newly_inserted, pending = _apply_approval_result(results, pending, result, attempt)
+        inserted += newly_inserted
+        if not pending:
+            break
+    
+    if inserted:
+        campaigns.update_one({"_id": ObjectId(campaign_id)}, {"$inc": {"approved_count": inserted}})
+    return results
+
 def save_approved_email(campaign_id: str, email_data: dict):
     """Save an approved email"""
-    email = {
-        "campaign_id": campaign_id,
-        "email_number": email_data["email_number"],
-        "subject": email_data["subject"],
-        "content": email_data["content"],
-        "feedback": email_data.get("feedback", ""),
-        "approved_at": datetime.utcnow()
-    }
-    return approved_emails.insert_one(email).inserted_id
+    result = approve_emails(campaign_id, [email_data])[0]
+    if result["status"] == "error":
+        raise Exception(result["error"])
+    return result["_id"]
+
+def delete_approved_email(campaign_id: str, email_number: int) -> bool:
+    """Remove an approved email and decrement the campaign's approved count"""
+    result = approved_emails.delete_one({"campaign_id": campaign_id, "email_number": email_number})
+    if result.deleted_count:
+        campaigns.update_one({"_id": ObjectId(campaign_id)}, {"$inc": {"approved_count": -1}})
+    return result.deleted_count > 0
 
 def verify_user_campaign_access(user_id: str, campaign_id: str) -> bool:
     """Verify user has access to campaign"""
@@ -57,37 +147,112 @@ def verify_user_campaign_access(user_id: str, campaign_id: str) -> bool:
     })
     return campaign is not None
 
-def get_user_campaigns(user_id: str):
-    """Get all campaigns for a user"""
+# Fields shown in the My Campaigns list
+CAMPAIGN_SUMMARY_FIELDS = {
+    "campaign_name": 1,
+    "product_name": 1,
+    "target_audience": 1,
+    "campaign_goal": 1,
+    "timeline": 1,
+    "num_emails": 1,
+    "status": 1,
+    "created_at": 1,
+    "approved_count": 1
+}
+
+def encode_campaign_cursor(campaign: dict) -> str:
+    """Encode the (created_at, _id) position of a campaign as an opaque cursor"""
+    position = {"created_at": campaign["created_at"].isoformat(), "_id": str(campaign["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_campaign_cursor(cursor: str) -> dict:
+    """Decode a cursor from encode_campaign_cursor"""
+    position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return {
+        "created_at": datetime.fromisoformat(position["created_at"]),
+        "_id": ObjectId(position["_id"])
+    }
+
+CAMPAIGN_PAGE_SORT = [("created_at", -1), ("_id", -1)]
+
+def _campaign_page_query(user_id: str, cursor: str = None, status: str = None,
+                         name_prefix: str = None) -> dict:
+    query = {"user_id": str(user_id)}
+    if status:
+        query["status"] = status
+    if name_prefix:
+        query["campaign_name"] = {"$regex": f"^{re.escape(name_prefix)}"}
+    if cursor:
+        position = decode_campaign_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": position["created_at"]}},
+            {"created_at": position["created_at"], "_id": {"$lt": position["_id"]}}
+        ]
+    return query
+
+def _campaign_page_result(page: list, page_size: int) -> dict:
+    """Trim the page_size + 1 probe row and build the next cursor from it"""
+    next_cursor = encode_campaign_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return {
+        "campaigns": [{"approved_count": 0, **campaign} for campaign in page[:page_size]],
+        "next_cursor": next_cursor
+    }
+
+def list_user_campaigns(user_id: str, page_size: int = 20, cursor: str = None,
+                        status: str = None, name_prefix: str = None) -> dict:
+    """
+    Get one page of a user's campaign summaries, newest first.
+
+    Uses keyset pagination on (user_id, created_at, _id): pass the returned
+    next_cursor to fetch the following page; it is None on the last page.
+    """
     try:
         if not user_id:
             print("Error: user_id is None")
-            return []
-            
-        user_id_str = str(user_id)
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": user_id_str
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "approved_emails",
-                    "localField": "_id",
-                    "foreignField": "campaign_id",
-                    "as": "emails"
-                }
-            },
-            {
-                "$sort": {"created_at": -1}
-            }
-        ]
+            return {"campaigns": [], "next_cursor": None}
         
-        return list(campaigns.aggregate(pipeline))
+        query = _campaign_page_query(user_id, cursor, status, name_prefix)
+        page = list(
+            campaigns.find(query, CAMPAIGN_SUMMARY_FIELDS)
+            .sort(CAMPAIGN_PAGE_SORT)
+            .limit(page_size + 1)
+        )
+        return _campaign_page_result(page, page_size)
     except Exception as e:
-        print(f"Error fetching campaigns: {e}")
-        return []
+        print(f"Error fetching campaign summaries: {e}")
+        return {"campaigns": [], "next_cursor": None}
+
+def remove_duplicate_approved_emails() -> int:
+    """Keep the latest approval of each (campaign_id, email_number) and delete the rest"""
+    duplicates = approved_emails.aggregate([
+        {"$sort": {"approved_at": -1}},
+        {"$group": {
+            "_id": {"campaign_id": "$campaign_id", "email_number": "$email_number"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    stale_ids = [stale_id for group in duplicates for stale_id in group["ids"][1:]]
+    deleted = 0
+    for start in range(0, len(stale_ids), 1000):
+        deleted += approved_emails.delete_many({"_id": {"$in": stale_ids[start:start + 1000]}}).deleted_count
+    return deleted
+
+def backfill_approved_counts() -> int:
+    """Recompute approved_count for every campaign from approved_emails"""
+    counts = {
+        str(row["_id"]): row["count"]
+        for row in approved_emails.aggregate([{"$group": {"_id": "$campaign_id", "count": {"$sum": 1}}}])
+    }
+    operations = [
+        UpdateOne({"_id": campaign["_id"]}, {"$set": {"approved_count": counts.get(str(campaign["_id"]), 0)}})
+        for campaign in campaigns.find({}, {"_id": 1})
+    ]
+    updated = 0
+    for start in range(0, len(operations), 1000):
+        updated += campaigns.bulk_write(operations[start:start + 1000], ordered=False).modified_count
+    return updated
 
 def get_campaign_details(campaign_id: str):
     """Get complete campaign details including strategy and approved emails"""
@@ -115,7 +280,9 @@ def verify_database_connection():
     """Verify database connection and campaign collection"""
     try:
         # Test database connection
-        campaigns.database.client.admin.command('ping')
+        connection = check_connection()
+        if connection["status"] != "connected":
+            return connection
         
         # Count total campaigns
         total_campaigns = campaigns.count_documents({})
@@ -124,7 +291,7 @@ def verify_database_connection():
         sample_campaign = campaigns.find_one()
         
         return {
-            "status": "connected",
+            **connection,
             "total_campaigns": total_campaigns,
             "sample_campaign": sample_campaign
         }
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from database import campaign_stats_daily
+from email_utils import EmailMarketingUtils
+
+METRIC_FIELDS = ["sent", "opens", "clicks", "conversions"]
+
+def day_start(when: datetime) -> datetime:
+    """Midnight (UTC) of the day containing when"""
+    return datetime(when.year, when.month, when.day)
+
+def daily_rollup_operation(user_id: str, campaign_id: str, day: datetime, counts: Dict) -> UpdateOne:
+    """$inc upsert adding counts to a campaign's rollup document for one day"""
+    return UpdateOne(
+        {"campaign_id": campaign_id, "day": day_start(day)},
+        {
+            "$inc": {field: counts[field] for field in METRIC_FIELDS if counts.get(field)},
+            "$setOnInsert": {"user_id": user_id}
+        },
+        upsert=True
+    )
+
+def record_daily_totals(user_id: str, campaign_id: str, day: datetime, counts: Dict):
+    """Add sent/opens/clicks/conversions to a campaign's daily rollup"""
+    campaign_stats_daily.bulk_write([daily_rollup_operation(user_id, campaign_id, day, counts)])
+
+def _rollup_totals(user_id: str, group_by: str, start: Optional[datetime],
+                   end: Optional[datetime]) -> List[Dict]:
+    match = {"user_id": user_id}
+    if start or end:
+        match["day"] = {}
+        if start:
+            match["day"]["$gte"] = day_start(start)
+        if end:
+            match["day"]["$lt"] = day_start(end) + timedelta(days=1)
+    return list(campaign_stats_daily.aggregate([
+        {"$match": match},
+        {"$group": {"_id": f"${group_by}", **{field: {"$sum": f"${field}"} for field in METRIC_FIELDS}}},
+        {"$sort": {"_id": 1}}
+    ]))
+
+def get_user_campaign_metrics(user_id: str, start: Optional[datetime] = None,
+                              end: Optional[datetime] = None, group_by: str = "campaign_id") -> Dict:
+    """
+    Metrics for all of a user's campaigns (group_by="campaign_id") or per
+    day across them (group_by="day"), from one aggregation over the daily
+    rollups. Returns column arrays: keys, the four totals and the rates.
+    """
+    rows = _rollup_totals(user_id, group_by, start, end)
+    totals = {field: [row.get(field, 0) for row in rows] for field in METRIC_FIELDS}
+    return {
+        "keys": [row["_id"] for row in rows],
+        **{field: totals[field] for field in METRIC_FIELDS},
+        **EmailMarketingUtils.calculate_metrics_batch(totals)
+    }
+
+def metrics_table(metrics: Dict) -> List[Dict]:
+    """Turn get_user_campaign_metrics columns into rows for display"""
+    return [
+        {
+            "key": key,
+            "sent": int(metrics["sent"][i]),
+            "opens": int(metrics["opens"][i]),
+            "clicks": int(metrics["clicks"][i]),
+            "conversions": int(metrics["conversions"][i]),
+            "open_rate": round(float(metrics["open_rate"][i]), 2),
+            "click_rate": round(float(metrics["click_rate"][i]), 2),
+            "conversion_rate": round(float(metrics["conversion_rate"][i]), 2)
+        }
+        for i, key in enumerate(metrics["keys"])
+    ]
@@ -1,54 +1,40 @@
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import os
-import certifi
+from db_config import get_database
+from indexes import ensure_indexes
 
-# Load environment variables
-load_dotenv()
+class LazyCollection:
+    """
+    Collection handle that resolves through the shared client on first use,
+    so importing this module never touches the network.
+    """
 
-# Get MongoDB connection string from environment variable
-MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+    def __init__(self, name: str):
+        self._name = name
+        self._collection = None
 
-try:
-    # Connect to MongoDB with SSL certificate verification
-    client = MongoClient(MONGODB_URI, tlsCAFile=certifi.where())
-    
-    # Test the connection
-    client.admin.command('ping')
-    print("Successfully connected to MongoDB!")
-    
-    # Initialize database and collections
-    db = client.email_marketing_db
-    users = db.users
-    campaigns = db.campaigns
-    approved_emails = db.approved_emails
-    strategies = db.strategies
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = get_database()[self._name]
+        return getattr(self._collection, attr)
 
-    # Create indexes
-    users.create_index("email", unique=True)
-    campaigns.create_index([("user_id", 1), ("campaign_name", 1)], unique=True)
+    def __repr__(self):
+        return f"LazyCollection({self._name!r})"
 
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-    # Fallback to a local MongoDB instance if cloud connection fails
-    try:
-        client = MongoClient("mongodb://localhost:27017")
-        db = client.email_marketing_db
-        users = db.users
-        campaigns = db.campaigns
-        approved_emails = db.approved_emails
-        strategies = db.strategies
-        
-        # Create indexes
-        users.create_index("email", unique=True)
-        campaigns.create_index([("user_id", 1), ("campaign_name", 1)], unique=True)
-        print("Connected to local MongoDB instance as fallback")
-    except Exception as e:
-        print(f"Error connecting to local MongoDB: {e}")
+# Collections
+users = LazyCollection("users")
+campaigns = LazyCollection("campaigns")
+approved_emails = LazyCollection("approved_emails")
+strategies = LazyCollection("strategies")
+subscribers = LazyCollection("subscribers")
+campaign_stats_daily = LazyCollection("campaign_stats_daily")
+engagement_hourly = LazyCollection("engagement_hourly")
+send_results = LazyCollection("send_results")
+scheduled_sends = LazyCollection("scheduled_sends")
 
 # Add these indexes and schema validations
 def setup_database_schema():
     try:
+        db = get_database()
+
         # User collection schema
         db.command({
             'collMod': 'users',
@@ -77,7 +63,7 @@ def setup_database_schema():
                     'properties': {
                         'user_id': {'bsonType': 'string'},
                         'campaign_name': {'bsonType': 'string'},
-                        'status': {'enum': ['draft', 'active', 'completed', 'archived']},
+                        'status': {'enum': ['draft', 'active', 'scheduled', 'launched', 'completed', 'archived', 'deleted']},
                         'created_at': {'bsonType': 'date'},
                         'updated_at': {'bsonType': 'date'}
                     }
@@ -86,10 +72,8 @@ def setup_database_schema():
         })
 
         # Create indexes
-        users.create_index("email", unique=True)
-        campaigns.create_index([("user_id", 1), ("campaign_name", 1)], unique=True)
-        campaigns.create_index("user_id")  # For faster user campaign lookups
+        ensure_indexes()
         
         print("Database schema and indexes created successfully!")
     except Exception as e:
-        print(f"Error setting up database schema: {e}")
\ No newline at end of file
+        print(f"Error setting up database schema: {e}")
@@ -2,61 +2,103 @@ from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 import certifi
-import ssl
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
 
+# Connection settings
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "email_marketing_db")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000"))
+# zlib ships with Python; add zstd/snappy if their packages are installed
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zlib")
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+def _uses_tls(uri: str) -> bool:
+    lowered = uri.lower()
+    return lowered.startswith("mongodb+srv://") or "tls=true" in lowered or "ssl=true" in lowered
+
+def _client_options() -> dict:
+    """Pool, timeout and compression settings shared by the sync and async clients"""
+    options = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGODB_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGODB_SOCKET_TIMEOUT_MS,
+        "compressors": MONGODB_COMPRESSORS,
+        "appname": "email-marketing-team"
+    }
+    if _uses_tls(MONGODB_URI):
+        options["tlsCAFile"] = certifi.where()
+    return options
+
+def get_client() -> MongoClient:
+    """
+    Return the process-wide MongoClient, creating it on first use.
+
+    Creating the client does not block on the network; the pool connects in
+    the background and the first operation waits at most the server
+    selection timeout.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGODB_URI, **_client_options())
+    return _client
+
+def get_async_client():
+    """
+    Return the process-wide motor client, creating it on first use.
+
+    Motor binds the client to the event loop it is first used on, so use it
+    from a single loop (async_campaign_manager runs one in a background
+    thread for sync callers).
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                _async_client = AsyncIOMotorClient(MONGODB_URI, **_client_options())
+    return _async_client
+
+def get_async_database():
+    """Return the application database on the shared motor client"""
+    return get_async_client()[MONGODB_DB_NAME]
+
 def get_database():
+    """Return the application database on the shared client"""
+    return get_client()[MONGODB_DB_NAME]
+
+def check_connection() -> dict:
+    """Ping the server; call from health checks, not on import"""
     try:
-        # Get MongoDB connection string from environment variable
-        MONGODB_URI = os.getenv("MONGODB_URI")
-        
-        # Configure MongoDB client with SSL settings
-        client = MongoClient(
-            MONGODB_URI,
-            tlsCAFile=certifi.where(),
-            ssl=True,
-            ssl_cert_reqs=ssl.CERT_NONE
-        )
-        
-        # Test the connection
-        client.admin.command('ping')
-        print("Successfully connected to MongoDB!")
-        
-        # Initialize database and collections
-        db = client.email_marketing_db
-        
-        return db
-    
+        started = time.perf_counter()
+        get_client().admin.command('ping')
+        return {"status": "connected", "latency_ms": (time.perf_counter() - started) * 1000}
     except Exception as e:
-        print(f"Error connecting to MongoDB: {e}")
-        print("Attempting to connect to local MongoDB...")
-        
-        try:
-            # Fallback to local MongoDB
-            client = MongoClient('mongodb://localhost:27017/')
-            db = client.email_marketing_db
-            print("Connected to local MongoDB successfully!")
-            return db
-        
-        except Exception as local_error:
-            print(f"Error connecting to local MongoDB: {local_error}")
-            raise Exception("Could not connect to any MongoDB instance")
-
-# Initialize database connection
-db = get_database()
-
-# Initialize collections
-users = db.users
-campaigns = db.campaigns
-approved_emails = db.approved_emails
-strategies = db.strategies
-
-# Create indexes
-try:
-    users.create_index("email", unique=True)
-    campaigns.create_index([("user_id", 1), ("campaign_name", 1)], unique=True)
-    print("Database indexes created successfully!")
-except Exception as e:
-    print(f"Error creating indexes: {e}")
+        return {"status": "error", "error": str(e)}
+
+def close_client():
+    """Close the shared clients and their pools"""
+    global _client, _async_client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
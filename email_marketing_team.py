@@ -1,26 +1,59 @@
-import google.generativeai as genai
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from llm_backends import LLMQuotaError, get_default_backend
+from llm_cache import get_response_cache
+from llm_usage import LLMBudgetError, UsageLog
+from rate_limiter import (
+    LLM_EXPECTED_OUTPUT_TOKENS,
+    backoff_delay,
+    call_with_backoff,
+    estimate_tokens,
+    get_rate_limiter,
+    is_quota_error,
+    is_retryable_error
+)
+from templates import compile_template
+import json
 import re
+import time
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Draft generation defaults
+DEFAULT_MAX_WORKERS = int(os.getenv("EMAIL_DRAFT_WORKERS", "4"))
+DEFAULT_MAX_RETRIES = 2
+# "per_email" makes one call per draft; "batch" asks for every draft in one JSON response
+DRAFT_MODES = ("per_email", "batch")
+DEFAULT_DRAFT_MODE = os.getenv("EMAIL_DRAFT_MODE", "per_email")
 
-def run_email_marketing_team(task, progress_callback=None):
-    if progress_callback:
-        progress_callback("🤔 Analyzing campaign requirements...")
-    
-    # Initialize Gemini model
-    model = genai.GenerativeModel('gemini-pro')
-    
-    if progress_callback:
-        progress_callback("📊 Generating campaign strategy...")
-    
-    # Generate campaign strategy
-    strategy_prompt = f"""
+# The brief replaces the full strategy in every draft prompt
+STRATEGY_BRIEF_MAX_WORDS = int(os.getenv("STRATEGY_BRIEF_MAX_WORDS", "150"))
+
+def build_campaign_task(campaign_data: dict, max_email_length: int = 250,
+                        include_images: bool = True, cta_style: str = "Button") -> str:
+    """Build the task description for a campaign from its saved fields"""
+    return f"""
+            We need to create an email campaign for our new product launch:
+            - Campaign: {campaign_data['campaign_name']}
+            - Product: {campaign_data['product_name']}
+            - Target audience: {campaign_data['target_audience']}
+            - Goal: {campaign_data['campaign_goal']}
+            - Timeline: {campaign_data['timeline']} weeks
+            - Number of Emails: {campaign_data['num_emails']}
+            - Frequency: {campaign_data['frequency']}
+            - Email Tone: {campaign_data['email_tone']}
+        
+            - Content Preferences:
+              * Maximum Length: {max_email_length} words
+              * Include Images: {include_images}
+              * CTA Style: {cta_style}
+            """
+
+def build_strategy_prompt(task: str) -> str:
+    """Build the prompt for the campaign strategy"""
+    return f"""
     As an email marketing strategist, create a detailed campaign strategy for the following task:
     {task}
     
@@ -30,25 +63,68 @@ def run_email_marketing_team(task, progress_callback=None):
     3. Email sequence plan
     4. Success metrics
     """
+
+def build_brief_prompt(strategy: str, num_emails: int) -> str:
+    """Build the prompt that condenses a strategy into a structured brief"""
+    return f"""
+    Condense this email campaign strategy into a STRATEGY BRIEF JSON object for a
+    sequence of {num_emails} emails, using at most {STRATEGY_BRIEF_MAX_WORDS} words in total.
+    Respond with JSON only, with exactly these keys:
+    {{"objective": str, "audience": str, "tone": str, "key_messages": [str], "cta": str,
+      "emails": [{{"email_number": int, "focus": str}}]}}
     
-    strategy_response = model.generate_content(strategy_prompt)
-    strategy = strategy_response.text
-    
-    # Extract number of emails from task
-    num_emails_match = re.search(r'Number of Emails: (\d+)', task)
-    num_emails = int(num_emails_match.group(1)) if num_emails_match else 1
-    
-    if progress_callback:
-        progress_callback("✍️ Crafting email drafts...")
-    
-    # Generate multiple email drafts
-    email_drafts = []
-    for i in range(num_emails):
-        email_prompt = f"""
+    Strategy:
+    {strategy}
+    """
+
+def _first_json(text: str, opening: str):
+    """
+    Decode the first JSON value in text that starts with opening ("[" or
+    "{"), ignoring any prose or code fences around it; None if there is none
+    """
+    decoder = json.JSONDecoder()
+    start = text.find(opening)
+    while start != -1:
+        try:
+            return decoder.raw_decode(text, start)[0]
+        except ValueError:
+            start = text.find(opening, start + 1)
+    return None
+
+def parse_strategy_brief(text: str) -> dict:
+    """Parse a brief response, tolerating code fences; raises ValueError if it is not a brief"""
+    brief = _first_json(text, "{")
+    if brief is None:
+        raise ValueError("No JSON object in brief response")
+    if not isinstance(brief, dict) or not isinstance(brief.get("emails", []), list):
+        raise ValueError("Brief is not an object with an emails list")
+    return brief
+
+def render_strategy_brief(brief: dict, email_number: int) -> str:
+    """Compact text of the shared brief plus this email's focus"""
+    focus = next(
+        (email.get("focus") for email in brief.get("emails", [])
+         if isinstance(email, dict) and email.get("email_number") == email_number),
+        None
+    )
+    lines = [
+        f"Objective: {brief.get('objective', '')}",
+        f"Audience: {brief.get('audience', '')}",
+        f"Tone: {brief.get('tone', '')}",
+        f"Key messages: {'; '.join(str(message) for message in brief.get('key_messages', []))}",
+        f"CTA: {brief.get('cta', '')}"
+    ]
+    if focus:
+        lines.append(f"This email's focus: {focus}")
+    return "\n        ".join(lines)
+
+def build_email_prompt(strategy: str, email_number: int, num_emails: int) -> str:
+    """Build the prompt for a single email draft from the strategy or its brief"""
+    return f"""
         Based on this strategy:
         {strategy}
         
-        Write email {i+1} of {num_emails} for this campaign. Make each email unique but connected.
+        Write email {email_number} of {num_emails} for this campaign. Make each email unique but connected.
         The email should have:
         1. An attention-grabbing subject line
         2. Persuasive body copy that builds on previous emails
@@ -61,31 +137,361 @@ def run_email_marketing_team(task, progress_callback=None):
         
         CTA: [Your call-to-action]
         """
+
+def render_batch_context(brief, strategy: str, num_emails: int) -> str:
+    """Shared brief once plus one focus line per email, for the batch prompt"""
+    if not brief:
+        return strategy
+    lines = [render_strategy_brief({**brief, "emails": []}, 0)]
+    for email in brief.get("emails", []):
+        if isinstance(email, dict) and email.get("focus"):
+            lines.append(f"Email {email.get('email_number')} focus: {email['focus']}")
+    return "\n        ".join(lines)
+
+def build_batch_email_prompt(context: str, num_emails: int) -> str:
+    """Build the prompt that asks for every draft in one DRAFT BATCH JSON response"""
+    return f"""
+        Based on this strategy:
+        {context}
+        
+        Write all {num_emails} emails of this campaign. Make each email unique but connected,
+        each with an attention-grabbing subject line, persuasive body copy that builds on the
+        previous emails, and a clear call-to-action.
         
-        email_response = model.generate_content(email_prompt)
-        email_drafts.append(email_response.text)
-        if progress_callback:
-            progress_callback(f"✍️ Crafting email draft {i+1} of {num_emails}...")
+        Respond with a DRAFT BATCH JSON array only, one object per email:
+        [{{"email_number": 1, "subject": "...", "body": "...", "cta": "..."}}]
+        """
+
+def parse_email_batch(text: str, num_emails: int):
+    """
+    Parse a batch response into {email_number: {"subject", "body", "cta"}}.
+    Returns the valid drafts and the sorted email numbers that are missing
+    or malformed; an unparseable response leaves every number invalid.
+    """
+    drafts = {}
+    items = _first_json(text, "[")
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        number = item.get("email_number")
+        fields = {field: item.get(field) for field in ("subject", "body", "cta")}
+        if (
+            isinstance(number, int) and not isinstance(number, bool) and 1 <= number <= num_emails and number not in drafts
+            and all(isinstance(value, str) and value.strip() for value in fields.values())
+        ):
+            drafts[number] = {field: value.strip() for field, value in fields.items()}
+    invalid = [number for number in range(1, num_emails + 1) if number not in drafts]
+    return drafts, invalid
+
+def format_email_draft(draft: dict) -> str:
+    """Render a parsed draft in the same text format per-email generation returns"""
+    return f"Subject: {draft['subject']}\n\n{draft['body']}\n\nCTA: {draft['cta']}"
+
+def _acquire(backend, prompt: str, session_id=None):
+    """Wait for rate limiter capacity before calling a quota-limited backend"""
+    if backend.rate_limited:
+        get_rate_limiter().acquire(estimate_tokens(prompt) + LLM_EXPECTED_OUTPUT_TOKENS, session_id)
+
+def _raise_for_quota(error: Exception):
+    if is_quota_error(error):
+        quota_error = LLMQuotaError(f"AI provider quota exhausted: {error}")
+        quota_error.attempts = getattr(error, "attempts", None)
+        raise quota_error from error
+    raise error
+
+def generate_text(backend, prompt: str, use_cache: bool = True,
+                  max_retries: int = DEFAULT_MAX_RETRIES, session_id=None,
+                  usage: UsageLog = None, call_name: str = "generate") -> str:
+    """
+    Generate a response, serving identical prompts from the response cache.
+    When usage is given the call is checked against its budget and recorded.
+    """
+    started = time.perf_counter()
+    cache = get_response_cache()
+    key = cache.make_key(backend.name, prompt, backend.generation_config)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            if usage:
+                usage.record(call_name, prompt, cached, time.perf_counter() - started, cached=True)
+            return cached
+    if usage:
+        usage.check([prompt], call_name)
     
-    if progress_callback:
-        progress_callback("✅ Finalizing campaign materials...")
+    def call():
+        _acquire(backend, prompt, session_id)
+        return backend.generate(prompt)
+    
+    try:
+        text = call_with_backoff(call, max_retries, get_rate_limiter())
+    except Exception as e:
+        _raise_for_quota(e)
+    cache.set(key, text)
+    if usage:
+        usage.record(call_name, prompt, text, time.perf_counter() - started)
+    return text
+
+def stream_text(backend, prompt: str, use_cache: bool = True,
+                max_retries: int = DEFAULT_MAX_RETRIES, session_id=None,
+                usage: UsageLog = None, call_name: str = "stream"):
+    """Yield response chunks, replaying a cached response as a single chunk"""
+    started = time.perf_counter()
+    cache = get_response_cache()
+    key = cache.make_key(backend.name, prompt, backend.generation_config)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            if usage:
+                usage.record(call_name, prompt, cached, time.perf_counter() - started, cached=True)
+            yield cached
+            return
+    if usage:
+        usage.check([prompt], call_name)
+    
+    chunks = []
+    for attempt in range(max_retries + 1):
+        try:
+            _acquire(backend, prompt, session_id)
+            for chunk in backend.stream(prompt):
+                chunks.append(chunk)
+                yield chunk
+            break
+        except Exception as e:
+            # Chunks already shown cannot be taken back, so only retry
+            # failures that happen before the first chunk
+            if chunks or attempt == max_retries or not is_retryable_error(e):
+                e.attempts = attempt + 1
+                _raise_for_quota(e)
+            delay = backoff_delay(attempt)
+            if is_quota_error(e):
+                get_rate_limiter().pause(delay)
+            print(f"Streaming call failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+    text = "".join(chunks)
+    cache.set(key, text)
+    if usage:
+        usage.record(call_name, prompt, text, time.perf_counter() - started)
+
+def generate_email_draft(backend, strategy: str, email_number: int, num_emails: int,
+                         max_retries: int = DEFAULT_MAX_RETRIES, use_cache: bool = True,
+                         session_id=None, usage: UsageLog = None) -> str:
+    """Generate one email draft; failures are retried for this draft only"""
+    email_prompt = build_email_prompt(strategy, email_number, num_emails)
+    return generate_text(backend, email_prompt, use_cache, max_retries, session_id,
+                         usage, f"draft {email_number}")
+
+def extract_strategy_brief(backend, strategy: str, num_emails: int, max_retries: int = DEFAULT_MAX_RETRIES,
+                           use_cache: bool = True, session_id=None, usage: UsageLog = None):
+    """
+    Condense the strategy once; returns the parsed brief, or None when the
+    model did not return a usable one and drafts should use the full
+    strategy. The brief is optional, so a failed call falls back the same
+    way; only quota and budget errors are raised.
+    """
+    try:
+        text = generate_text(backend, build_brief_prompt(strategy, num_emails), use_cache, max_retries,
+                             session_id, usage, "strategy brief")
+    except (LLMQuotaError, LLMBudgetError):
+        raise
+    except Exception as e:
+        print(f"Strategy brief call failed, drafting from the strategy instead: {e}")
+        return None
+    try:
+        return parse_strategy_brief(text)
+    except ValueError as e:
+        print(f"Could not parse strategy brief, drafting from the strategy instead: {e}")
+        return None
+
+def _generate_drafts(backend, draft_contexts, email_numbers, num_emails, max_workers, max_retries,
+                     use_cache, session_id, usage):
+    """
+    Generate the given drafts concurrently with one call each, yielding
+    (email_number, text, error) as they finish. Quota and budget errors
+    are raised instead, and the drafts not yet started are cancelled:
+    the rest would fail the same way.
+    """
+    workers = max(1, min(max_workers or 1, len(email_numbers)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                generate_email_draft, backend, draft_contexts[number - 1], number, num_emails, max_retries,
+                use_cache, session_id, usage
+            ): number
+            for number in email_numbers
+        }
+        for future in as_completed(futures):
+            try:
+                text = future.result()
+            except (LLMQuotaError, LLMBudgetError):
+                for pending in futures:
+                    pending.cancel()
+                raise
+            except Exception as e:
+                yield futures[future], None, e
+            else:
+                yield futures[future], text, None
+
+def stream_email_marketing_team(task, max_workers=DEFAULT_MAX_WORKERS,
+                                max_retries=DEFAULT_MAX_RETRIES, use_cache=True, backend=None,
+                                session_id=None, token_budget=None, draft_mode=DEFAULT_DRAFT_MODE):
+    """
+    Run the campaign pipeline, yielding events as content becomes available.
+
+    Events are dicts with a "type" key:
+    - "progress": {"message"} status text
+    - "strategy_chunk": {"text"} strategy tokens as they stream in
+    - "strategy": {"text"} the complete strategy
+    - "brief": {"brief"} the structured brief drafts are written from (None
+      if it could not be parsed and drafts use the full strategy)
+    - "draft": {"email_number", "text", "failed"} each draft as soon as it finishes
+    - "done": {"results"} the same dict run_email_marketing_team returns
+
+    Pass use_cache=False to bypass cached responses (fresh responses are
+    still written back to the cache). backend defaults to the one selected
+    by LLM_BACKEND. session_id identifies the caller to the shared rate
+    limiter so concurrent sessions are served fairly. token_budget caps
+    the estimated prompt plus response tokens spent on the campaign
+    (default LLM_CAMPAIGN_TOKEN_BUDGET); calls that would exceed it raise
+    LLMBudgetError before they are sent. Per-call character and token
+    counts are returned under "usage".
+
+    draft_mode "batch" requests every draft in one JSON response and
+    regenerates only the missing or malformed ones with per-email calls;
+    "per_email" makes one call per draft. A draft that fails is replaced
+    by a placeholder and listed in failed_drafts, except that an exhausted
+    provider quota raises LLMQuotaError so the caller can ask to retry.
+    """
+    if draft_mode not in DRAFT_MODES:
+        raise ValueError(f"Unknown draft mode {draft_mode!r}; expected one of {DRAFT_MODES}")
+    yield {"type": "progress", "message": "🤔 Analyzing campaign requirements..."}
+    
+    started = time.perf_counter()
+    backend = backend or get_default_backend()
+    usage = UsageLog(token_budget)
+    
+    yield {"type": "progress", "message": "📊 Generating campaign strategy..."}
+    
+    # Generate campaign strategy
+    strategy_chunks = []
+    for text in stream_text(backend, build_strategy_prompt(task), use_cache, max_retries, session_id,
+                            usage, "strategy"):
+        strategy_chunks.append(text)
+        yield {"type": "strategy_chunk", "text": text}
+    strategy = "".join(strategy_chunks)
+    yield {"type": "strategy", "text": strategy}
+    
+    # Extract number of emails from task
+    num_emails_match = re.search(r'Number of Emails: (\d+)', task)
+    num_emails = int(num_emails_match.group(1)) if num_emails_match else 1
+    
+    # Drafts are written from a compact brief extracted once, rather than
+    # repeating the full strategy in every draft prompt
+    yield {"type": "progress", "message": "🗂️ Summarizing strategy for the drafts..."}
+    brief = extract_strategy_brief(backend, strategy, num_emails, max_retries, use_cache, session_id, usage)
+    yield {"type": "brief", "brief": brief}
+    draft_contexts = [
+        render_strategy_brief(brief, i + 1) if brief else strategy
+        for i in range(num_emails)
+    ]
+    
+    yield {"type": "progress", "message": "✍️ Crafting email drafts..."}
+    
+    email_drafts = [None] * num_emails
+    failed_drafts = []
+    repaired_drafts = []
+    pending = list(range(1, num_emails + 1))
+    completed = 0
+    if draft_mode == "batch":
+        batch_prompt = build_batch_email_prompt(render_batch_context(brief, strategy, num_emails), num_emails)
+        usage.check([batch_prompt], f"{num_emails} email drafts", num_emails)
+        try:
+            batch_text = generate_text(backend, batch_prompt, use_cache, max_retries, session_id,
+                                       usage, "draft batch")
+        except (LLMQuotaError, LLMBudgetError):
+            raise
+        except Exception as e:
+            print(f"Batched draft call failed, generating each draft separately: {e}")
+            batch_text = ""
+        drafts, pending = parse_email_batch(batch_text, num_emails)
+        for number, draft in sorted(drafts.items()):
+            email_drafts[number - 1] = format_email_draft(draft)
+            completed += 1
+            yield {"type": "draft", "email_number": number, "text": email_drafts[number - 1], "failed": False}
+        if pending:
+            # Only the missing or malformed items get follow-up calls
+            repaired_drafts = list(pending)
+            yield {"type": "progress", "message": f"🔧 Regenerating drafts {pending} individually..."}
+    else:
+        usage.check(
+            [build_email_prompt(context, i + 1, num_emails) for i, context in enumerate(draft_contexts)],
+            f"{num_emails} email drafts"
+        )
+    
+    # Every draft depends only on the strategy, so drafts are generated
+    # concurrently and collected back into their original order.
+    for number, text, error in _generate_drafts(backend, draft_contexts, pending, num_emails, max_workers,
+                                                max_retries, use_cache, session_id, usage):
+        if error:
+            # Keep the drafts that succeeded; only this one is lost
+            attempts = getattr(error, "attempts", None)
+            print(f"Email draft {number} failed after {attempts} attempt{'s' if attempts != 1 else ''}: {error}"
+                  if attempts else f"Email draft {number} failed: {error}")
+            failed_drafts.append(number)
+            text = f"Subject: Draft {number} unavailable\n\nGeneration failed: {error}"
+        email_drafts[number - 1] = text
+        completed += 1
+        yield {"type": "draft", "email_number": number, "text": text, "failed": bool(error)}
+        yield {
+            "type": "progress",
+            "message": f"✍️ Crafted email draft {number} ({completed} of {num_emails} done)..."
+        }
+    
+    yield {"type": "progress", "message": "✅ Finalizing campaign materials..."}
     
     # Generate HTML preview if requested
     html_preview = None
     if "Generate HTML Preview: True" in task:
         html_preview = generate_html_preview(email_drafts[0])  # Preview first email
     
-    return {
-        "strategy": strategy,
-        "email_drafts": email_drafts,
-        "html_preview": html_preview
+    usage_summary = usage.summary()
+    usage_summary["totals"]["elapsed_seconds"] = time.perf_counter() - started
+    totals = usage_summary["totals"]
+    print(f"Campaign LLM usage: {totals['calls']} calls ({totals['cached_calls']} cached), "
+          f"~{totals['prompt_tokens']} prompt + ~{totals['response_tokens']} response tokens, "
+          f"{totals['prompt_chars']} prompt chars, {totals['elapsed_seconds']:.2f}s")
+    
+    yield {
+        "type": "done",
+        "results": {
+            "strategy": strategy,
+            "strategy_brief": brief,
+            "email_drafts": email_drafts,
+            "failed_drafts": sorted(failed_drafts),
+            "draft_mode": draft_mode,
+            "repaired_drafts": repaired_drafts,
+            "html_preview": html_preview,
+            "usage": usage_summary
+        }
     }
 
-def generate_html_preview(email_text):
-    # Simple HTML template for email preview
-    html_template = f"""
+def run_email_marketing_team(task, progress_callback=None, max_workers=DEFAULT_MAX_WORKERS,
+                             max_retries=DEFAULT_MAX_RETRIES, use_cache=True, backend=None,
+                             session_id=None, token_budget=None, draft_mode=DEFAULT_DRAFT_MODE):
+    results = None
+    for event in stream_email_marketing_team(task, max_workers, max_retries, use_cache, backend,
+                                             session_id, token_budget, draft_mode):
+        if event["type"] == "progress" and progress_callback:
+            progress_callback(event["message"])
+        elif event["type"] == "done":
+            results = event["results"]
+    return results
+
+PREVIEW_TEMPLATE = """
     <div style="max-width: 600px; margin: 0 auto; font-family: Arial, sans-serif; padding: 20px;">
-        {email_text.replace('\n', '<br>')}
+        {{ email_text|nl2br }}
     </div>
     """
-    return html_template
\ No newline at end of file
+
+def generate_html_preview(email_text):
+    # Simple HTML template for email preview; the draft text is escaped
+    return compile_template(PREVIEW_TEMPLATE).render({"email_text": email_text})
@@ -1,5 +1,57 @@
+import hashlib
 import re
+import numpy as np
 from typing import Dict, List
+from segmentation import SubscriberStore, criteria_predicate
+from templates import compile_template
+
+# Compiled once; validate_email runs per row during imports
+EMAIL_PATTERN = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+
+def normalize_email(email: str) -> str:
+    """
+    Canonical form used for deduplication and suppression
+    """
+    return email.strip().lower()
+
+def email_hash64(email: str) -> int:
+    """
+    64-bit hash of a normalized address
+    """
+    return int.from_bytes(hashlib.blake2b(email.encode("utf-8"), digest_size=8).digest(), "little")
+
+# Layout used by generate_html_template and the send engine; body is trusted HTML
+EMAIL_TEMPLATE = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>{{ subject }}</title>
+        </head>
+        <body>
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h1>{{ headline }}</h1>
+                <div>{{ body|raw }}</div>
+                <div style="margin-top: 20px;">
+                    <a href="{{ cta_link }}" 
+                       style="background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">
+                        {{ cta_text }}
+                    </a>
+                </div>
+            </div>
+            {{ tracking_pixel|raw }}
+        </body>
+        </html>
+        """
+
+EMAIL_TEMPLATE_DEFAULTS = {
+    'subject': '',
+    'headline': '',
+    'body': '',
+    'cta_link': '#',
+    'cta_text': 'Click Here',
+    'tracking_pixel': ''
+}
 
 class EmailMarketingUtils:
     @staticmethod
@@ -7,8 +59,7 @@ class EmailMarketingUtils:
         """
         Validate email format
         """
-        pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-        return bool(re.match(pattern, email))
+        return bool(EMAIL_PATTERN.match(email))
 
     @staticmethod
     def calculate_metrics(campaign_data: Dict) -> Dict:
@@ -29,11 +80,41 @@ class EmailMarketingUtils:
         
         return metrics
 
+    @staticmethod
+    def calculate_metrics_batch(totals: Dict) -> Dict:
+        """
+        Vectorized calculate_metrics for many campaigns or time buckets at once;
+        totals maps 'sent', 'opens', 'clicks' and 'conversions' to equal-length arrays
+        """
+        sent = np.asarray(totals.get('sent', []), dtype=np.float64)
+        opens = np.asarray(totals.get('opens', np.zeros_like(sent)), dtype=np.float64)
+        clicks = np.asarray(totals.get('clicks', np.zeros_like(sent)), dtype=np.float64)
+        conversions = np.asarray(totals.get('conversions', np.zeros_like(sent)), dtype=np.float64)
+
+        def rate(numerator, denominator):
+            return np.divide(numerator * 100, denominator,
+                             out=np.zeros_like(numerator), where=denominator > 0)
+
+        return {
+            'open_rate': rate(opens, sent),
+            'click_rate': rate(clicks, opens),
+            'conversion_rate': rate(conversions, clicks),
+            'total_sent': sent.astype(np.int64)
+        }
+
     @staticmethod
     def segment_audience(subscribers: List[Dict], criteria: Dict) -> List[Dict]:
         """
         Segment email list based on given criteria
         """
+        # Compatibility wrapper over the columnar engine in segmentation.py
+        try:
+            store = SubscriberStore.from_records(subscribers, criteria.keys(), categorical=True)
+            return [subscribers[i] for i in store.select(criteria_predicate(criteria))]
+        except TypeError:
+            # Unhashable values can't be dictionary-encoded; compare one by one
+            pass
+        
         segmented_list = []
         
         for subscriber in subscribers:
@@ -51,25 +132,4 @@ class EmailMarketingUtils:
         """
         Generate basic HTML email template
         """
-        template = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{content.get('subject', '')}</title>
-        </head>
-        <body>
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <h1>{content.get('headline', '')}</h1>
-                <div>{content.get('body', '')}</div>
-                <div style="margin-top: 20px;">
-                    <a href="{content.get('cta_link', '#')}" 
-                       style="background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">
-                        {content.get('cta_text', 'Click Here')}
-                    </a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        return template 
\ No newline at end of file
+        return next(compile_template(EMAIL_TEMPLATE).render_batch([{}], content, EMAIL_TEMPLATE_DEFAULTS))
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Compact set of 64-bit hashes for deduplicating very large address lists.
+
+Open addressing over a NumPy uint64 table (about 16 bytes per entry at the
+maximum load factor, against roughly 70 for a Python set of ints), with
+vectorized batch inserts.
+"""
+import numpy as np
+
+_EMPTY = np.uint64(0)
+
+class HashSet64:
+    MAX_LOAD = 0.5
+
+    def __init__(self, capacity: int = 1 << 16):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self._table = np.zeros(size, dtype=np.uint64)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add_many(self, hashes) -> np.ndarray:
+        """
+        Insert a batch of hashes; returns a bool array that is True where
+        the hash was not in the set before (first occurrence within the
+        batch counts as new).
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        # 0 marks empty slots, so store it as 1
+        hashes = np.where(hashes == _EMPTY, np.uint64(1), hashes)
+        is_new = np.zeros(len(hashes), dtype=bool)
+        unique, first = np.unique(hashes, return_index=True)
+        if (self._count + len(unique)) > self.MAX_LOAD * len(self._table):
+            self._grow(self._count + len(unique))
+
+        inserted = self._insert(unique)
+        is_new[first[inserted]] = True
+        self._count += int(inserted.sum())
+        return is_new
+
+    def contains_many(self, hashes) -> np.ndarray:
+        """Vectorized membership test"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        hashes = np.where(hashes == _EMPTY, np.uint64(1), hashes)
+        mask = np.uint64(len(self._table) - 1)
+        found = np.zeros(len(hashes), dtype=bool)
+        pending = np.arange(len(hashes))
+        slots = hashes & mask
+        while len(pending):
+            current = self._table[slots[pending]]
+            found[pending[current == hashes[pending]]] = True
+            pending = pending[(current != hashes[pending]) & (current != _EMPTY)]
+            slots[pending] = (slots[pending] + np.uint64(1)) & mask
+        return found
+
+    def _insert(self, unique: np.ndarray) -> np.ndarray:
+        """Insert distinct hashes; returns True where a hash was newly added"""
+        table = self._table
+        mask = np.uint64(len(table) - 1)
+        inserted = np.zeros(len(unique), dtype=bool)
+        pending = np.arange(len(unique))
+        slots = unique & mask
+        while len(pending):
+            current = table[slots[pending]]
+            values = unique[pending]
+            # Already present: done, not new
+            keep = current != values
+            pending, current, values = pending[keep], current[keep], values[keep]
+            empty = current == _EMPTY
+            # Claim empty slots; when several hashes race for one slot the
+            # last write wins and the others keep probing
+            table[slots[pending[empty]]] = values[empty]
+            won = empty & (table[slots[pending]] == values)
+            inserted[pending[won]] = True
+            pending = pending[~won]
+            slots[pending] = (slots[pending] + np.uint64(1)) & mask
+        return inserted
+
+    def _grow(self, needed: int):
+        size = len(self._table)
+        while needed > self.MAX_LOAD * size:
+            size <<= 1
+        existing = self._table[self._table != _EMPTY]
+        self._table = np.zeros(size, dtype=np.uint64)
+        self._insert(existing)
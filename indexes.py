@@ -0,0 +1,303 @@
+"""
+Declared indexes for every collection and query-plan checks.
+
+    python maintenance.py ensure-indexes
+    python maintenance.py check-query-plans
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from db_config import get_database
+
+# Every index the app relies on, by collection. Indexes that existing
+# deployments already have keep the default names they were created with:
+# MongoDB refuses the same keys under a second name.
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+    ],
+    "campaigns": [
+        # Campaign names are unique per user; also serves lookups by user
+        IndexModel([("user_id", ASCENDING), ("campaign_name", ASCENDING)],
+                   name="user_id_1_campaign_name_1", unique=True),
+        # Keyset pagination for My Campaigns, optionally filtered by status
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                   name="user_created_at"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING),
+                    ("_id", DESCENDING)],
+                   name="user_status_created_at"),
+    ],
+    "approved_emails": [
+        # One approval per email; makes approval upserts idempotent
+        IndexModel([("campaign_id", ASCENDING), ("email_number", ASCENDING)],
+                   name="campaign_email_number_unique", unique=True),
+    ],
+    "strategies": [
+        IndexModel([("campaign_id", ASCENDING)], name="campaign_id"),
+    ],
+    "subscribers": [
+        # One subscription per normalized address per list
+        IndexModel([("list_id", ASCENDING), ("email", ASCENDING)], name="list_email_unique", unique=True),
+        # Scheduler chunks walk a list in _id order
+        IndexModel([("list_id", ASCENDING), ("_id", ASCENDING)], name="list_id_order"),
+    ],
+    "campaign_stats_daily": [
+        # One rollup document per campaign per day
+        IndexModel([("campaign_id", ASCENDING), ("day", ASCENDING)], name="campaign_day_unique", unique=True),
+        # Per-user dashboards over a date range
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], name="user_day"),
+    ],
+    "engagement_hourly": [
+        # One counter document per campaign email per hour
+        IndexModel([("campaign_id", ASCENDING), ("email_number", ASCENDING), ("hour", ASCENDING)],
+                   name="campaign_email_hour_unique", unique=True),
+    ],
+    "send_results": [
+        IndexModel([("campaign_id", ASCENDING), ("email_number", ASCENDING), ("status", ASCENDING)],
+                   name="campaign_email_status"),
+        # Retried scheduler jobs skip recipients that were already sent
+        IndexModel([("campaign_id", ASCENDING), ("email_number", ASCENDING), ("email", ASCENDING)],
+                   name="campaign_email_recipient"),
+    ],
+    "scheduled_sends": [
+        # The send queue: only queued jobs are indexed, so finished jobs cost nothing
+        IndexModel([("available_at", ASCENDING)], name="queued_available_at",
+                   partialFilterExpression={"state": "queued"}),
+        IndexModel([("campaign_id", ASCENDING), ("state", ASCENDING)], name="campaign_state"),
+    ],
+}
+
+class IndexCreationError(Exception):
+    """Raised after every collection was tried if any failed; carries both outcomes"""
+
+    def __init__(self, errors: dict, created: dict):
+        super().__init__("; ".join(f"{collection}: {error}" for collection, error in errors.items()))
+        self.errors = errors
+        self.created = created
+
+def ensure_indexes(db=None) -> dict:
+    """
+    Create every declared index (idempotent) and return their names by
+    collection. A failing collection (e.g. a unique index blocked by
+    duplicates) does not stop the others; IndexCreationError is raised at
+    the end with the per-collection errors.
+    """
+    db = db if db is not None else get_database()
+    created = {}
+    errors = {}
+    for collection, models in INDEXES.items():
+        try:
+            created[collection] = db[collection].create_indexes(models)
+        except Exception as e:
+            errors[collection] = str(e)
+    if errors:
+        raise IndexCreationError(errors, created)
+    return created
+
+class _RecordingCursor:
+    def __init__(self, entry: dict, documents: list):
+        self._entry = entry
+        self._documents = documents
+
+    def sort(self, key, direction=None):
+        self._entry["sort"] = [(key, direction or ASCENDING)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, count):
+        return self
+
+    def skip(self, count):
+        return self
+
+    def __iter__(self):
+        return iter(self._documents)
+
+class _RecordingResult:
+    matched_count = modified_count = deleted_count = upserted_count = 0
+    upserted_id = inserted_id = None
+    inserted_ids = []
+    bulk_api_result = {"upserted": [], "writeErrors": []}
+
+class _RecordingCollection:
+    """
+    Stands in for a collection while real app functions run: every filter
+    they send is recorded, reads return the given sample documents.
+    """
+
+    def __init__(self, name: str, queries: list, documents: list):
+        self.name = name
+        self._queries = queries
+        self._documents = documents
+
+    def _record(self, query, sort=None) -> dict:
+        entry = {"collection": self.name, "filter": query or {}, "sort": sort}
+        self._queries.append(entry)
+        return entry
+
+    def find(self, filter=None, *args, **kwargs):
+        return _RecordingCursor(self._record(filter), self._documents)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        self._record(filter, kwargs.get("sort"))
+        return self._documents[0] if self._documents else None
+
+    def find_one_and_update(self, filter, update, *args, **kwargs):
+        self._record(filter, kwargs.get("sort"))
+        return self._documents[0] if self._documents else {"_id": ObjectId()}
+
+    def _write(self, filter, *args, **kwargs):
+        self._record(filter)
+        return _RecordingResult()
+
+    update_one = update_many = delete_one = delete_many = replace_one = _write
+
+    def count_documents(self, filter, *args, **kwargs):
+        self._record(filter)
+        return 0
+
+    def bulk_write(self, operations, *args, **kwargs):
+        for operation in operations:
+            if getattr(operation, "_filter", None) is not None:
+                self._record(operation._filter)
+        return _RecordingResult()
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        if pipeline and "$match" in pipeline[0]:
+            self._record(pipeline[0]["$match"])
+        return iter([])
+
+    def insert_one(self, document, *args, **kwargs):
+        return _RecordingResult()
+
+    def insert_many(self, documents, *args, **kwargs):
+        return _RecordingResult()
+
+def record_queries(call, documents: dict = None) -> list:
+    """
+    Run call with every app collection replaced by a recorder and return
+    the queries it issued as {"collection", "filter", "sort"}. documents
+    maps collection names to the sample documents reads return, so code
+    behind an existence check runs too. Exceptions from call are ignored:
+    the queries issued before them are still recorded.
+    """
+    import database
+
+    queries = []
+    collections = [value for value in vars(database).values() if isinstance(value, database.LazyCollection)]
+    saved = [collection._collection for collection in collections]
+    try:
+        for collection in collections:
+            collection._collection = _RecordingCollection(
+                collection._name, queries, (documents or {}).get(collection._name, [])
+            )
+        try:
+            call()
+        except Exception as e:
+            print(f"(query recording stopped early: {e})")
+    finally:
+        for collection, original in zip(collections, saved):
+            collection._collection = original
+    return queries
+
+def query_calls() -> list:
+    """
+    (name, call, sample documents) for every query path of the app. The
+    filters come from running the real functions, so this list cannot
+    drift from the queries the code actually sends.
+    """
+    import auth
+    import campaign_manager
+    import campaign_metrics
+    import scheduler
+    import send_engine
+    import tracking
+
+    campaign_id = ObjectId()
+    day = datetime(2024, 1, 1)
+    cursor = campaign_manager.encode_campaign_cursor({"created_at": day, "_id": campaign_id})
+    campaign = {"_id": campaign_id, "user_id": "user"}
+    job = {
+        "_id": f"{campaign_id}:1:0", "user_id": "user", "campaign_id": str(campaign_id), "email_number": 1,
+        "list_id": "list", "after_id": ObjectId(), "until_id": None, "attempts": 2
+    }
+
+    def flush_events():
+        from database import campaign_stats_daily, engagement_hourly
+        buffer = tracking.EventBuffer(engagement_hourly, campaign_stats_daily)
+        buffer._counts[("user", str(campaign_id), 1, day, "opens")] += 1
+        buffer.flush()
+
+    return [
+        ("login by email", lambda: auth.login_user("user@example.com", "password"), None),
+        ("save_campaign upsert", lambda: campaign_manager.save_campaign("user", {
+            "campaign_name": "Launch", "product_name": "P", "target_audience": "T", "campaign_goal": "G",
+            "timeline": 4, "num_emails": 3, "frequency": "Weekly", "email_tone": "Neutral",
+            "template_style": "Minimal"
+        }), None),
+        ("verify_user_campaign_access",
+         lambda: campaign_manager.verify_user_campaign_access("user", str(campaign_id)), None),
+        ("list_user_campaigns first page", lambda: campaign_manager.list_user_campaigns("user"), None),
+        ("list_user_campaigns next page", lambda: campaign_manager.list_user_campaigns("user", cursor=cursor), None),
+        ("list_user_campaigns by status",
+         lambda: campaign_manager.list_user_campaigns("user", cursor=cursor, status="draft"), None),
+        ("list_user_campaigns by name prefix",
+         lambda: campaign_manager.list_user_campaigns("user", name_prefix="Lau"), None),
+        ("get_campaign_details", lambda: campaign_manager.get_campaign_details(str(campaign_id)),
+         {"campaigns": [campaign]}),
+        ("approve_emails", lambda: campaign_manager.approve_emails(str(campaign_id), [
+            {"email_number": 1, "subject": "S", "content": "C"}
+        ]), None),
+        ("delete_approved_email", lambda: campaign_manager.delete_approved_email(str(campaign_id), 1), None),
+        ("user metrics rollup", lambda: campaign_metrics.get_user_campaign_metrics("user", start=day), None),
+        ("daily rollup upsert",
+         lambda: campaign_metrics.record_daily_totals("user", str(campaign_id), day, {"sent": 1}), None),
+        ("tracking flush", flush_events, None),
+        ("send approved email lookup",
+         lambda: send_engine.SendEngine(pool=object()).send_campaign_email("user", str(campaign_id), 1, []), None),
+        ("scheduler chunk boundaries", lambda: scheduler._list_chunks("list", 1000), None),
+        ("scheduler prefetch", lambda: scheduler.SchedulerWorker("check").prefetch(day), None),
+        ("scheduler claim", lambda: scheduler.SchedulerWorker("check").claim(job["_id"], day), None),
+        ("scheduler recipients and already sent", lambda: scheduler.SchedulerWorker("check")._recipients(job),
+         {"subscribers": [{"email": "a@example.com"}]}),
+        ("scheduler campaign pending", lambda: scheduler.has_queued_jobs(str(campaign_id)), None),
+    ]
+
+def _stages(plan):
+    """Yield every stage name in an explain plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+def check_query_plans(db=None) -> list:
+    """
+    Explain every query the app issues (recorded by running the real code
+    paths in query_calls) and return the names of those whose winning plan
+    contains a COLLSCAN (an empty list means every query is indexed). Run
+    after ensure_indexes: a missing collection explains as EOF and would
+    pass without checking anything.
+    """
+    db = db if db is not None else get_database()
+    failures = []
+    for name, call, documents in query_calls():
+        queries = record_queries(call, documents)
+        if not queries:
+            print(f"{'NO QUERY':9} {name}")
+            failures.append(name)
+        for query in queries:
+            command = {"find": query["collection"], "filter": query["filter"]}
+            if query["sort"]:
+                command["sort"] = dict(query["sort"])
+            explain = db.command({"explain": command, "verbosity": "queryPlanner"})
+            stages = list(_stages(explain["queryPlanner"]["winningPlan"]))
+            status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+            print(f"{status:9} {name} ({query['collection']}): {' <- '.join(stages)}")
+            if status == "COLLSCAN" and name not in failures:
+                failures.append(name)
+    return failures
@@ -0,0 +1,83 @@
+"""
+Coalesced last_login writes.
+
+login_user records the login time here instead of updating the user
+document on the request path. A background thread flushes the pending
+times as one unordered bulk_write every LAST_LOGIN_FLUSH_SECONDS (the
+upper bound on staleness) or as soon as LAST_LOGIN_BATCH_SIZE users are
+pending, and once more at interpreter shutdown.
+"""
+import os
+import threading
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "5"))
+LAST_LOGIN_BATCH_SIZE = int(os.getenv("LAST_LOGIN_BATCH_SIZE", "500"))
+
+class LastLoginWriter:
+    """Buffers user_id -> latest login time and writes them in batches"""
+
+    def __init__(self, collection, flush_seconds: float = LAST_LOGIN_FLUSH_SECONDS,
+                 batch_size: int = LAST_LOGIN_BATCH_SIZE):
+        self.collection = collection
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def record(self, user_id, when: datetime = None):
+        """Queue a login; only the latest time per user is written"""
+        when = when or datetime.utcnow()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="last-login-writer", daemon=True)
+                self._thread.start()
+            if self._pending.get(user_id) is None or self._pending[user_id] < when:
+                self._pending[user_id] = when
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write all pending login times now; returns the number of users written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            operations = [
+                # $max keeps the newest time if an older batch lands late
+                UpdateOne({"_id": user_id}, {"$max": {"last_login": when}})
+                for user_id, when in pending.items()
+            ]
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                print(f"Error writing last_login batch: {e}")
+                # Put the batch back unless newer logins arrived meanwhile
+                with self._lock:
+                    for user_id, when in pending.items():
+                        if self._pending.get(user_id) is None or self._pending[user_id] < when:
+                            self._pending[user_id] = when
+                return 0
+            return len(operations)
+
+    def stop(self):
+        """Flush remaining logins and stop the background thread"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Backend settings
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-pro")
+
+class LLMBackendError(Exception):
+    """Raised when a backend fails to produce a response"""
+
+class LLMQuotaError(LLMBackendError):
+    """Raised when the provider quota is still exhausted after retries"""
+
+class LLMBackend:
+    """
+    Interface the campaign pipeline uses to talk to a language model.
+
+    Implementations provide generate(); stream() defaults to yielding the
+    full response as one chunk. name and generation_config identify the
+    model for response caching. Calls to backends with rate_limited set go
+    through the shared rate limiter.
+    """
+    name = "base"
+    generation_config: Dict = {}
+    rate_limited = False
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield self.generate(prompt)
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini backend, configured on first use rather than at import"""
+    rate_limited = True
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME, generation_config: Optional[Dict] = None,
+                 api_key: Optional[str] = None):
+        self.name = model_name
+        self.generation_config = generation_config or {}
+        self._api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self._api_key)
+                    self._model = genai.GenerativeModel(
+                        self.name, generation_config=self.generation_config or None
+                    )
+        return self._model
+
+    def generate(self, prompt: str) -> str:
+        return self._get_model().generate_content(prompt).text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._get_model().generate_content(prompt, stream=True):
+            yield chunk.text
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend returning deterministic text for a prompt.
+
+    latency_seconds is spent per call (split across streamed chunks) and
+    failure_rate is the probability a call raises LLMBackendError, drawn
+    from a generator seeded with seed so runs are reproducible. Set
+    rate_limited to exercise the shared rate limiter offline.
+    seconds_per_token adds latency proportional to the response length
+    (about four characters per token), like a real model's decode time.
+    malformed_rate is the probability each item of a batched draft
+    response comes back invalid, to exercise repair calls.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0, seed: int = 0,
+                 chunk_words: int = 8, name: str = "stub", rate_limited: bool = False,
+                 seconds_per_token: float = 0.0, malformed_rate: float = 0.0):
+        self.name = name
+        self.rate_limited = rate_limited
+        self.generation_config = {}
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.chunk_words = chunk_words
+        self.seconds_per_token = seconds_per_token
+        self.malformed_rate = malformed_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+        if failed:
+            raise LLMBackendError("Injected stub failure")
+
+    def _respond(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        if "STRATEGY BRIEF JSON" in prompt:
+            match = re.search(r"sequence of (\d+) emails", prompt)
+            num_emails = int(match.group(1)) if match else 1
+            return json.dumps({
+                "objective": f"Grow awareness and conversions ({digest})",
+                "audience": "Existing subscribers",
+                "tone": "Friendly",
+                "key_messages": ["value", "urgency", "social proof"],
+                "cta": "Learn more",
+                "emails": [
+                    {"email_number": i, "focus": ("introduction", "benefits", "offer")[(i - 1) % 3]}
+                    for i in range(1, num_emails + 1)
+                ]
+            })
+        if "DRAFT BATCH JSON" in prompt:
+            match = re.search(r"Write all (\d+) emails", prompt)
+            drafts = []
+            for i in range(1, (int(match.group(1)) if match else 1) + 1):
+                with self._lock:
+                    malformed = self._random.random() < self.malformed_rate
+                drafts.append({
+                    "email_number": i,
+                    "subject": f"Stub subject {digest}-{i}",
+                    "body": f"Stub email body {i} for prompt {digest}. "
+                            "It builds on the previous emails and keeps the campaign message consistent.",
+                    "cta": "" if malformed else f"Learn more ({digest}-{i})"
+                })
+            return json.dumps(drafts)
+        if "Write email" in prompt:
+            return (
+                f"Subject: Stub subject {digest}\n\n"
+                f"Stub email body for prompt {digest}. "
+                "It builds on the previous emails and keeps the campaign message consistent.\n\n"
+                f"CTA: Learn more ({digest})"
+            )
+        return (
+            f"Stub campaign strategy {digest}\n"
+            "1. Campaign objectives: grow awareness and conversions\n"
+            "2. Key messaging points: value, urgency, social proof\n"
+            "3. Email sequence plan: introduction, benefits, offer\n"
+            "4. Success metrics: open rate, click rate, conversion rate"
+        )
+
+    def _latency(self, response: str) -> float:
+        return self.latency_seconds + self.seconds_per_token * len(response) / 4
+
+    def generate(self, prompt: str) -> str:
+        self._maybe_fail()
+        response = self._respond(prompt)
+        if self._latency(response):
+            time.sleep(self._latency(response))
+        return response
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        self._maybe_fail()
+        response = self._respond(prompt)
+        words = response.split(" ")
+        chunks = [" ".join(words[i:i + self.chunk_words]) for i in range(0, len(words), self.chunk_words)]
+        for i, chunk in enumerate(chunks):
+            if self._latency(response):
+                time.sleep(self._latency(response) / len(chunks))
+            yield chunk if i == len(chunks) - 1 else chunk + " "
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+def get_default_backend() -> LLMBackend:
+    """Return the process-wide backend selected by LLM_BACKEND"""
+    global _default_backend
+    if _default_backend is None:
+        with _default_backend_lock:
+            if _default_backend is None:
+                if LLM_BACKEND == "stub":
+                    _default_backend = StubBackend(
+                        latency_seconds=float(os.getenv("LLM_STUB_LATENCY_SECONDS", "0")),
+                        failure_rate=float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+                    )
+                else:
+                    _default_backend = GeminiBackend()
+    return _default_backend
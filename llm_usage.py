@@ -0,0 +1,81 @@
+"""
+Per-call prompt and response accounting for the campaign pipeline.
+
+Token counts are the same four-characters-per-token estimate the rate
+limiter uses, so they are comparable across backends and available before
+a call is made, which is what a budget check needs.
+"""
+import os
+import threading
+from typing import Dict, List, Optional
+
+from rate_limiter import LLM_EXPECTED_OUTPUT_TOKENS, estimate_tokens
+
+# Default per-campaign token budget; 0 means unlimited
+LLM_CAMPAIGN_TOKEN_BUDGET = int(os.getenv("LLM_CAMPAIGN_TOKEN_BUDGET", "0"))
+
+class LLMBudgetError(Exception):
+    """Raised when a call would take a campaign past its token budget"""
+
+class UsageLog:
+    """
+    Thread-safe record of every LLM call made for one campaign. Cached
+    responses are recorded too but cost nothing against the budget.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None):
+        self.token_budget = LLM_CAMPAIGN_TOKEN_BUDGET if token_budget is None else token_budget
+        self.calls: List[Dict] = []
+        self._spent = 0
+        self._lock = threading.Lock()
+
+    def check(self, prompts: List[str], label: str = "call", responses_per_prompt: int = 1):
+        """Raise LLMBudgetError if prompts (plus expected output) would exceed the budget"""
+        if not self.token_budget:
+            return
+        projected = sum(
+            estimate_tokens(prompt) + LLM_EXPECTED_OUTPUT_TOKENS * responses_per_prompt for prompt in prompts
+        )
+        with self._lock:
+            spent = self._spent
+        if spent + projected > self.token_budget:
+            raise LLMBudgetError(
+                f"{label} needs about {projected} tokens but only "
+                f"{max(0, self.token_budget - spent)} of the {self.token_budget} token budget remain"
+            )
+
+    def record(self, name: str, prompt: str, response: str, latency_seconds: float, cached: bool = False):
+        call = {
+            "name": name,
+            "prompt_chars": len(prompt),
+            "prompt_tokens": estimate_tokens(prompt),
+            "response_chars": len(response),
+            "response_tokens": estimate_tokens(response),
+            "latency_seconds": latency_seconds,
+            "cached": cached
+        }
+        with self._lock:
+            self.calls.append(call)
+            if not cached:
+                self._spent += call["prompt_tokens"] + call["response_tokens"]
+
+    def totals(self) -> Dict:
+        with self._lock:
+            calls = list(self.calls)
+        billed = [call for call in calls if not call["cached"]]
+        return {
+            "calls": len(calls),
+            "cached_calls": len(calls) - len(billed),
+            "prompt_chars": sum(call["prompt_chars"] for call in billed),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in billed),
+            "response_chars": sum(call["response_chars"] for call in billed),
+            "response_tokens": sum(call["response_tokens"] for call in billed),
+            "latency_seconds": sum(call["latency_seconds"] for call in calls),
+            "token_budget": self.token_budget or None
+        }
+
+    def summary(self) -> Dict:
+        """Totals plus every call, as returned with pipeline results"""
+        with self._lock:
+            calls = list(self.calls)
+        return {"totals": self.totals(), "calls": calls}
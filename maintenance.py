@@ -0,0 +1,59 @@
+"""
+Database maintenance commands.
+
+    python maintenance.py dedupe-approved-emails
+    python maintenance.py backfill-approved-counts
+    python maintenance.py ensure-indexes
+    python maintenance.py check-query-plans
+"""
+import argparse
+import sys
+
+from campaign_manager import backfill_approved_counts, remove_duplicate_approved_emails
+from indexes import IndexCreationError, check_query_plans, ensure_indexes
+
+def main():
+    parser = argparse.ArgumentParser(description="Database maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "dedupe-approved-emails",
+        help="Delete duplicate approvals so the unique approval index can be built"
+    )
+    commands.add_parser(
+        "backfill-approved-counts",
+        help="Recompute each campaign's approved_count from approved_emails"
+    )
+    commands.add_parser("ensure-indexes", help="Create every declared index")
+    commands.add_parser(
+        "check-query-plans",
+        help="Explain every app query and exit non-zero if any does a COLLSCAN"
+    )
+    args = parser.parse_args()
+
+    if args.command == "dedupe-approved-emails":
+        deleted = remove_duplicate_approved_emails()
+        print(f"Deleted {deleted} duplicate approved emails")
+    elif args.command == "backfill-approved-counts":
+        updated = backfill_approved_counts()
+        print(f"Updated approved_count on {updated} campaigns")
+    elif args.command == "ensure-indexes":
+        errors = {}
+        try:
+            created = ensure_indexes()
+        except IndexCreationError as e:
+            created, errors = e.created, e.errors
+        for collection, names in created.items():
+            print(f"{collection}: {', '.join(names)}")
+        for collection, error in errors.items():
+            print(f"{collection}: FAILED {error}")
+        if errors:
+            sys.exit(1)
+    elif args.command == "check-query-plans":
+        failures = check_query_plans()
+        if failures:
+            print(f"{len(failures)} queries use a collection scan: {failures}")
+            sys.exit(1)
+        print("All queries use an index")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Password hashing on a process pool.
+
+pbkdf2_sha256 is CPU-bound and holds the GIL, so hashing and verification
+run in worker processes (PASSWORD_HASH_WORKERS, default one per core) to
+keep them off the Streamlit script threads. At most
+PASSWORD_HASH_QUEUE_SIZE operations are queued at once; further callers
+wait for a slot. PASSWORD_HASH_ROUNDS sets the cost; hashes made with a
+different cost are reported by needs_rehash so login can upgrade them.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.hash import pbkdf2_sha256
+
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", str(pbkdf2_sha256.default_rounds)))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", str(PASSWORD_HASH_WORKERS * 4)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_queue_slots = threading.BoundedSemaphore(max(1, PASSWORD_HASH_QUEUE_SIZE))
+
+def _hash(password: str, rounds: int) -> str:
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pbkdf2_sha256.verify(password, hashed_password)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: forking the multi-threaded app server is not safe
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _executor
+
+def _run(fn, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    with _queue_slots:
+        return _get_executor().submit(fn, *args).result()
+
+def hash_password(password: str, rounds: int = None) -> str:
+    """Hash a password with the configured cost"""
+    return _run(_hash, password, rounds or PASSWORD_HASH_ROUNDS)
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """Check a password against a stored hash"""
+    return _run(_verify, password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True if the hash was made with a different cost than configured"""
+    return pbkdf2_sha256.using(rounds=PASSWORD_HASH_ROUNDS).needs_update(hashed_password)
+
+def shutdown():
+    """Stop the worker processes"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
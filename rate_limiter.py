@@ -0,0 +1,158 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+# Provider quota settings
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "120000"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+
+# Backoff settings
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+QUOTA_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests"}
+TRANSIENT_ERROR_NAMES = {
+    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+    "LLMBackendError", "ConnectionError", "TimeoutError"
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+def is_quota_error(error: Exception) -> bool:
+    """True for provider quota / rate limit errors"""
+    message = str(error).lower()
+    return (type(error).__name__ in QUOTA_ERROR_NAMES
+            or "429" in message or "quota" in message or "rate limit" in message)
+
+def is_retryable_error(error: Exception) -> bool:
+    """True for quota errors and transient provider or network failures"""
+    return is_quota_error(error) or type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS,
+                  maximum: float = BACKOFF_MAX_SECONDS) -> float:
+    """Exponential backoff with full jitter for the given attempt (0-based)"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+class TokenBucket:
+    """Bucket holding up to capacity units, refilled continuously at rate units per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount units are available (0 if available now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+class RateLimiter:
+    """
+    Process-wide limiter for requests and tokens per minute.
+
+    Callers wait in a per-session FIFO and sessions are served round-robin,
+    so one session submitting many calls cannot starve the others. A quota
+    error reported through pause() holds every caller back until the
+    backoff delay has passed.
+    """
+
+    def __init__(self, requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int, session_id: Optional[str] = None):
+        """Block until one request and tokens tokens may be spent"""
+        ticket = object()
+        with self._condition:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._next_ticket() is ticket:
+                        wait = max(
+                            self._paused_until - now,
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now)
+                        )
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            return
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+            finally:
+                self._remove(session_id, ticket)
+                self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Stop granting calls for seconds, e.g. after a quota error"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def _next_ticket(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _remove(self, session_id, ticket):
+        queue = self._queues[session_id]
+        was_head = queue[0] is ticket
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[session_id]
+        elif was_head and next(iter(self._queues)) == session_id:
+            # Served this session; let the next session go first
+            self._queues.move_to_end(session_id)
+
+def call_with_backoff(fn: Callable, max_retries: int, limiter: Optional[RateLimiter] = None,
+                      description: str = "LLM call"):
+    """
+    Call fn, retrying quota and transient errors with jittered exponential
+    backoff. The error finally raised carries the number of calls made as
+    its attempts attribute.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_error(e):
+                e.attempts = attempt + 1
+                raise
+            delay = backoff_delay(attempt)
+            if limiter and is_quota_error(e):
+                limiter.pause(delay)
+            print(f"{description} failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter shared by every session"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
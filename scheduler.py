@@ -0,0 +1,345 @@
+"""
+Persistent send scheduler.
+
+Launching a campaign turns its timeline and frequency into a send time per
+email and writes one job per email per chunk of the subscriber list into
+scheduled_sends. Jobs stay in state "queued" until they are done or have
+failed too often. available_at is the due time of an unclaimed job and the
+lease expiry of a claimed one, so a single partial index on queued jobs
+serves both claiming and recovery: a job whose worker died becomes
+claimable again once its lease runs out.
+
+Workers read the next few seconds of the queue into an in-memory timer
+wheel and claim each job with an atomic find_one_and_update when its slot
+fires, so any number of worker processes can share the queue without
+scanning it.
+
+    python scheduler.py launch <campaign_id> --list-id <list_id>
+    python scheduler.py worker --owner worker-1
+"""
+import argparse
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from campaign_manager import update_campaign_status
+from database import campaigns, scheduled_sends, send_results, subscribers
+
+SCHEDULER_CHUNK_SIZE = int(os.getenv("SCHEDULER_CHUNK_SIZE", "1000"))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+SCHEDULER_LOOKAHEAD_SECONDS = int(os.getenv("SCHEDULER_LOOKAHEAD_SECONDS", "30"))
+SCHEDULER_PREFETCH_LIMIT = int(os.getenv("SCHEDULER_PREFETCH_LIMIT", "1000"))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_MAX_ATTEMPTS", "5"))
+SCHEDULER_RETRY_SECONDS = int(os.getenv("SCHEDULER_RETRY_SECONDS", "60"))
+# Recipients sent between lease renewals
+SCHEDULER_SEND_BATCH = int(os.getenv("SCHEDULER_SEND_BATCH", "200"))
+# Subscriber columns passed to templates as {{ recipient.<field> }}; nothing else is loaded
+SEND_MERGE_FIELDS = [field.strip() for field in os.getenv("SEND_MERGE_FIELDS", "first_name,last_name,name").split(",")
+                     if field.strip()]
+
+FREQUENCY_INTERVALS = {
+    "Daily": timedelta(days=1),
+    "Weekly": timedelta(weeks=1),
+    "Bi-weekly": timedelta(weeks=2),
+    "Monthly": timedelta(days=30),
+}
+
+def send_times(start: datetime, num_emails: int, timeline_weeks: int, frequency: str) -> List[datetime]:
+    """
+    Send time per email: one every frequency interval from start, squeezed
+    evenly into the timeline when that many intervals would overrun it.
+    """
+    interval = FREQUENCY_INTERVALS.get(frequency, FREQUENCY_INTERVALS["Weekly"])
+    timeline = timedelta(weeks=timeline_weeks)
+    if num_emails > 1 and interval * (num_emails - 1) > timeline:
+        interval = timeline / (num_emails - 1)
+    return [start + interval * i for i in range(num_emails)]
+
+def _list_chunks(list_id: str, chunk_size: int) -> List[Tuple[Optional[ObjectId], Optional[ObjectId]]]:
+    """
+    Split a subscriber list into (after_id, until_id] ranges of chunk_size
+    subscribers. The last range is open-ended so later signups still get
+    the emails that have not gone out yet.
+    """
+    bounds = []
+    cursor = subscribers.find({"list_id": list_id}, {"_id": 1}).sort("_id", ASCENDING)
+    for position, subscriber in enumerate(cursor, 1):
+        if position % chunk_size == 0:
+            bounds.append(subscriber["_id"])
+    starts = [None] + bounds
+    ends = bounds + [None]
+    return list(zip(starts, ends))
+
+def _campaign_chunks(campaign: Dict, list_id: str, chunk_size: int) -> List[Tuple[Optional[ObjectId], Optional[ObjectId]]]:
+    """
+    Chunk bounds for a campaign, computed on first launch and stored on the
+    campaign. Relaunching reuses them, so a list that grew in between can
+    never produce chunks overlapping ones that are already queued.
+    """
+    if campaign.get("send_chunks") is None:
+        chunks = _list_chunks(list_id, chunk_size)
+        # Only the first launch wins if two race
+        campaigns.update_one(
+            {"_id": campaign["_id"], "send_chunks": {"$exists": False}},
+            {"$set": {"send_list_id": list_id, "send_chunks": [list(chunk) for chunk in chunks]}}
+        )
+        campaign = campaigns.find_one({"_id": campaign["_id"]}, {"send_list_id": 1, "send_chunks": 1})
+    if campaign["send_list_id"] != list_id:
+        raise ValueError(f"Campaign was already launched for list {campaign['send_list_id']!r}")
+    return [tuple(chunk) for chunk in campaign["send_chunks"]]
+
+def schedule_campaign(user_id: str, campaign_id: str, list_id: str, start: Optional[datetime] = None,
+                      chunk_size: int = SCHEDULER_CHUNK_SIZE, merge_fields: Optional[List[str]] = None) -> Dict:
+    """
+    Queue every email of a campaign for a subscriber list. Job ids are
+    derived from campaign, email and chunk, and chunk bounds are fixed at
+    the first launch, so launching twice is a no-op. Relaunching for a
+    different list raises ValueError.
+    merge_fields (default SEND_MERGE_FIELDS) are the only subscriber
+    columns besides email that are loaded for rendering.
+    """
+    campaign = campaigns.find_one({"_id": ObjectId(campaign_id), "user_id": user_id})
+    if not campaign:
+        raise ValueError(f"Campaign {campaign_id} not found")
+
+    now = datetime.utcnow()
+    times = send_times(start or now, campaign["num_emails"], campaign["timeline"], campaign["frequency"])
+    chunks = _campaign_chunks(campaign, list_id, chunk_size)
+    operations = []
+    for email_number, due_at in enumerate(times, 1):
+        for chunk_number, (after_id, until_id) in enumerate(chunks):
+            job_id = f"{campaign_id}:{email_number}:{chunk_number}"
+            operations.append(UpdateOne({"_id": job_id}, {"$setOnInsert": {
+                "user_id": user_id,
+                "campaign_id": campaign_id,
+                "email_number": email_number,
+                "list_id": list_id,
+                "after_id": after_id,
+                "until_id": until_id,
+                "merge_fields": list(SEND_MERGE_FIELDS if merge_fields is None else merge_fields),
+                "state": "queued",
+                "available_at": due_at,
+                "lease_owner": None,
+                "attempts": 0,
+                "created_at": now
+            }}, upsert=True))
+
+    scheduled = 0
+    for position in range(0, len(operations), 1000):
+        scheduled += scheduled_sends.bulk_write(operations[position:position + 1000], ordered=False).upserted_count
+    update_campaign_status(campaign_id, "scheduled")
+    return {"jobs": len(operations), "scheduled": scheduled, "send_times": times}
+
+def has_queued_jobs(campaign_id: str) -> bool:
+    """True while any send of the campaign is still queued or leased"""
+    return scheduled_sends.find_one({"campaign_id": campaign_id, "state": "queued"}, {"_id": 1}) is not None
+
+class TimerWheel:
+    """
+    Hashed timer wheel: items land in the slot for their due tick, and
+    advance() returns everything due without touching later slots. Items
+    more than one revolution out stay in their slot until their turn.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512, now: Optional[float] = None):
+        self.tick_seconds = tick_seconds
+        self.slots = [[] for _ in range(slots)]
+        self.keys = set()
+        self.current_tick = int((time.time() if now is None else now) // tick_seconds)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, due: float, key: Hashable, item=None) -> bool:
+        """Schedule item under key; returns False if key is already pending"""
+        if key in self.keys:
+            return False
+        # Overdue items fire on the next advance
+        tick = max(int(due // self.tick_seconds), self.current_tick)
+        self.slots[tick % len(self.slots)].append((tick, key, item))
+        self.keys.add(key)
+        return True
+
+    def advance(self, now: float) -> List[Tuple[Hashable, object]]:
+        """Return (key, item) for every entry due at or before now"""
+        target = int(now // self.tick_seconds)
+        # Past a full revolution every slot is visited once
+        ticks = range(self.current_tick, min(target, self.current_tick + len(self.slots) - 1) + 1)
+        due = []
+        for tick in ticks:
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            remaining = []
+            for entry in slot:
+                if entry[0] <= target:
+                    due.append((entry[1], entry[2]))
+                    self.keys.discard(entry[1])
+                else:
+                    remaining.append(entry)
+            self.slots[tick % len(self.slots)] = remaining
+        self.current_tick = target
+        return due
+
+class SchedulerWorker:
+    def __init__(self, owner: Optional[str] = None, engine=None,
+                 lease_seconds: int = SCHEDULER_LEASE_SECONDS,
+                 lookahead_seconds: int = SCHEDULER_LOOKAHEAD_SECONDS,
+                 prefetch_limit: int = SCHEDULER_PREFETCH_LIMIT):
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.engine = engine
+        self.lease_seconds = lease_seconds
+        self.lookahead_seconds = lookahead_seconds
+        self.prefetch_limit = prefetch_limit
+        self.wheel = TimerWheel()
+        self.next_prefetch = 0.0
+        self.stats = {"prefetched": 0, "claimed": 0, "lost": 0, "done": 0, "retried": 0, "failed": 0}
+
+    def prefetch(self, now: datetime):
+        """Load ids of queued jobs available within the lookahead into the wheel"""
+        horizon = now + timedelta(seconds=self.lookahead_seconds)
+        jobs = scheduled_sends.find(
+            {"state": "queued", "available_at": {"$lte": horizon}},
+            {"available_at": 1}
+        ).sort("available_at", ASCENDING).limit(self.prefetch_limit)
+        for job in jobs:
+            due = (job["available_at"] - datetime(1970, 1, 1)).total_seconds()
+            if self.wheel.add(due, job["_id"]):
+                self.stats["prefetched"] += 1
+
+    def claim(self, job_id: str, now: datetime) -> Optional[Dict]:
+        """Atomically lease a job if it is still available; None if another worker has it"""
+        job = scheduled_sends.find_one_and_update(
+            {"_id": job_id, "state": "queued", "available_at": {"$lte": now}},
+            {
+                "$set": {"available_at": now + timedelta(seconds=self.lease_seconds), "lease_owner": self.owner},
+                "$inc": {"attempts": 1}
+            },
+            return_document=True
+        )
+        self.stats["claimed" if job else "lost"] += 1
+        return job
+
+    def renew(self, job: Dict) -> bool:
+        """Extend this worker's lease on a job; False if the lease was lost"""
+        result = scheduled_sends.update_one(
+            {"_id": job["_id"], "lease_owner": self.owner, "state": "queued"},
+            {"$set": {"available_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    def _recipients(self, job: Dict) -> List[Dict]:
+        query = {"list_id": job["list_id"]}
+        id_range = {}
+        if job["after_id"] is not None:
+            id_range["$gt"] = job["after_id"]
+        if job["until_id"] is not None:
+            id_range["$lte"] = job["until_id"]
+        if id_range:
+            query["_id"] = id_range
+        projection = {"_id": 0, "email": 1}
+        projection.update({field: 1 for field in job.get("merge_fields", SEND_MERGE_FIELDS) if field != "_id"})
+        recipients = list(subscribers.find(query, projection))
+        if job["attempts"] > 1 and recipients:
+            # A previous lease may have died mid-chunk; skip who already got it
+            already_sent = {result["email"] for result in send_results.find({
+                "campaign_id": job["campaign_id"],
+                "email_number": job["email_number"],
+                "email": {"$in": [recipient["email"] for recipient in recipients]},
+                "status": "sent"
+            }, {"email": 1})}
+            recipients = [recipient for recipient in recipients if recipient["email"] not in already_sent]
+        return recipients
+
+    def run_job(self, job: Dict):
+        """Send one claimed job and record the outcome, unless the lease was lost meanwhile"""
+        if self.engine is None:
+            from send_engine import SendEngine
+            self.engine = SendEngine()
+        lease = {"_id": job["_id"], "lease_owner": self.owner}
+        summary = {"sent": 0, "failed": 0, "suppressed": 0}
+        try:
+            recipients = self._recipients(job)
+            # Renewing before every batch keeps a long chunk from being
+            # reclaimed (and resent) by another worker while it is in progress
+            for position in range(0, len(recipients), SCHEDULER_SEND_BATCH):
+                if not self.renew(job):
+                    print(f"Lost the lease on job {job['_id']}; leaving it to its new owner")
+                    self.stats["lost"] += 1
+                    return
+                batch_summary = self.engine.send_campaign_email(
+                    job["user_id"], job["campaign_id"], job["email_number"],
+                    recipients[position:position + SCHEDULER_SEND_BATCH]
+                )
+                for key in summary:
+                    summary[key] += batch_summary.get(key, 0)
+        except Exception as e:
+            print(f"Error sending job {job['_id']}: {e}")
+            if job["attempts"] >= SCHEDULER_MAX_ATTEMPTS:
+                scheduled_sends.update_one(lease, {"$set": {"state": "failed", "last_error": str(e)}})
+                self.stats["failed"] += 1
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=SCHEDULER_RETRY_SECONDS * job["attempts"])
+                scheduled_sends.update_one(lease, {"$set": {
+                    "available_at": retry_at, "lease_owner": None, "last_error": str(e)
+                }})
+                self.stats["retried"] += 1
+            return
+
+        scheduled_sends.update_one(lease, {"$set": {
+            "state": "done", "completed_at": datetime.utcnow(), "result": summary
+        }})
+        self.stats["done"] += 1
+        if not has_queued_jobs(job["campaign_id"]):
+            update_campaign_status(job["campaign_id"], "completed")
+
+    def run_once(self) -> int:
+        """Prefetch if due, then claim and run every job whose slot has fired"""
+        clock = time.time()
+        now = datetime.utcnow()
+        if clock >= self.next_prefetch or not len(self.wheel):
+            self.prefetch(now)
+            self.next_prefetch = clock + self.lookahead_seconds / 2
+        ran = 0
+        for job_id, _ in self.wheel.advance(clock):
+            job = self.claim(job_id, datetime.utcnow())
+            if job:
+                self.run_job(job)
+                ran += 1
+        return ran
+
+    def run_forever(self, idle_seconds: float = 1.0):
+        print(f"Scheduler worker {self.owner} started")
+        while True:
+            if not self.run_once():
+                time.sleep(idle_seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description="Campaign send scheduler")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    launch = commands.add_parser("launch", help="Queue every email of a campaign for a subscriber list")
+    launch.add_argument("campaign_id")
+    launch.add_argument("--list-id", required=True)
+    launch.add_argument("--user-id", help="Campaign owner (default: read from the campaign)")
+
+    worker = commands.add_parser("worker", help="Claim and send due jobs until interrupted")
+    worker.add_argument("--owner", help="Lease owner name (default: host-pid-random)")
+
+    args = parser.parse_args()
+    if args.command == "launch":
+        user_id = args.user_id or campaigns.find_one({"_id": ObjectId(args.campaign_id)})["user_id"]
+        result = schedule_campaign(user_id, args.campaign_id, args.list_id)
+        print(json.dumps(result, indent=2, default=str))
+    else:
+        SchedulerWorker(args.owner).run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Columnar, indexed audience segmentation.
+
+SubscriberStore keeps one NumPy column per attribute. Categorical columns
+are dictionary-encoded with a packed bitmap per value (built on first
+use); numeric columns keep a sorted copy and its permutation so ranges are
+two binary searches. Predicates evaluate to packed bitmaps, so AND / OR /
+NOT cost n/8 bytes each, and a segment is returned as a compact array of
+row indexes.
+
+    store = SubscriberStore.from_columns({"country": countries, "age": ages})
+    segment = store.select((Eq("country", "DE") | Eq("country", "AT")) & Range("age", 18, 34))
+"""
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+class CategoricalColumn:
+    """Dictionary-encoded column with lazily built per-value bitmaps"""
+
+    def __init__(self, codes: np.ndarray, categories: list):
+        self.codes = codes
+        self.categories = categories
+        self._code_of = {value: code for code, value in enumerate(categories)}
+        self._bitmaps = {}
+
+    @classmethod
+    def from_values(cls, values) -> "CategoricalColumn":
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            categories, codes = np.unique(values, return_inverse=True)
+            return cls(codes.astype(np.int32), categories.tolist())
+        code_of = {}
+        codes = np.fromiter(
+            (code_of.setdefault(value, len(code_of)) for value in values),
+            dtype=np.int32, count=len(values)
+        )
+        return cls(codes, list(code_of))
+
+    def bitmap(self, value, size: int) -> np.ndarray:
+        code = self._code_of.get(value)
+        if code is None:
+            return np.zeros((size + 7) // 8, dtype=np.uint8)
+        if code not in self._bitmaps:
+            self._bitmaps[code] = np.packbits(self.codes == code)
+        return self._bitmaps[code]
+
+class NumericColumn:
+    """Numeric column with a sorted index for range lookups"""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        self.order = np.argsort(values, kind="stable")
+        self.sorted_values = values[self.order]
+
+    def range_bitmap(self, low, high, include_low: bool, include_high: bool, size: int) -> np.ndarray:
+        start = 0 if low is None else np.searchsorted(
+            self.sorted_values, low, side="left" if include_low else "right")
+        # NaNs sort last and never fall inside a range
+        valid_end = len(self.sorted_values)
+        if np.issubdtype(self.sorted_values.dtype, np.floating):
+            valid_end = np.searchsorted(self.sorted_values, np.nan, side="left")
+        end = valid_end if high is None else min(valid_end, np.searchsorted(
+            self.sorted_values, high, side="right" if include_high else "left"))
+        mask = np.zeros(size, dtype=bool)
+        mask[self.order[start:end]] = True
+        return np.packbits(mask)
+
+class SubscriberStore:
+    """Column store of subscriber attributes"""
+
+    def __init__(self, columns: Dict[str, object], size: int):
+        self.columns = columns
+        self.size = size
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Iterable]) -> "SubscriberStore":
+        """Build from attribute -> values; numeric arrays get a sorted index"""
+        built = {}
+        size = None
+        for name, values in columns.items():
+            array = values if isinstance(values, np.ndarray) else np.asarray(values)
+            if array.dtype.kind in "iuf":
+                built[name] = NumericColumn(array)
+            else:
+                built[name] = CategoricalColumn.from_values(
+                    array if array.dtype.kind in "US" else list(values))
+            if size is not None and len(array) != size:
+                raise ValueError(f"Column {name!r} has {len(array)} rows, expected {size}")
+            size = len(array)
+        return cls(built, size or 0)
+
+    @classmethod
+    def from_records(cls, records: List[Dict], fields: Optional[Iterable[str]] = None,
+                     categorical: bool = False) -> "SubscriberStore":
+        """
+        Build from a list of dicts. Missing attributes become None. With
+        categorical=True every field is dictionary-encoded, which matches
+        plain == comparison exactly for any hashable values.
+        """
+        if fields is None:
+            fields = sorted({key for record in records for key in record})
+        columns = {}
+        for field in fields:
+            values = [record.get(field) for record in records]
+            if not categorical and values and all(
+                    isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+                columns[field] = NumericColumn(np.asarray(values))
+            else:
+                columns[field] = CategoricalColumn.from_values(values)
+        return cls(columns, len(records))
+
+    def column(self, name: str):
+        if name not in self.columns:
+            raise KeyError(f"Unknown subscriber attribute {name!r}")
+        return self.columns[name]
+
+    def all_bitmap(self) -> np.ndarray:
+        return np.packbits(np.ones(self.size, dtype=bool))
+
+    def select(self, predicate: "Predicate") -> np.ndarray:
+        """Return the row indexes matching predicate, ascending"""
+        bits = np.unpackbits(predicate.bitmap(self), count=self.size)
+        dtype = np.uint32 if self.size < 2 ** 32 else np.uint64
+        return np.flatnonzero(bits).astype(dtype)
+
+    def count(self, predicate: "Predicate") -> int:
+        """Number of rows matching predicate"""
+        return int(np.unpackbits(predicate.bitmap(self), count=self.size).sum())
+
+class Predicate:
+    """Base class; combine predicates with &, | and ~"""
+
+    def bitmap(self, store: SubscriberStore) -> np.ndarray:
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+class Eq(Predicate):
+    def __init__(self, field: str, value):
+        self.field = field
+        self.value = value
+
+    def bitmap(self, store):
+        column = store.column(self.field)
+        if isinstance(column, NumericColumn):
+            return column.range_bitmap(self.value, self.value, True, True, store.size)
+        return column.bitmap(self.value, store.size)
+
+class In(Predicate):
+    def __init__(self, field: str, values: Iterable):
+        self.field = field
+        self.values = list(values)
+
+    def bitmap(self, store):
+        return Or(*(Eq(self.field, value) for value in self.values)).bitmap(store)
+
+class Range(Predicate):
+    """low <= field <= high; either bound may be None, and bounds can be made exclusive"""
+
+    def __init__(self, field: str, low=None, high=None, include_low: bool = True,
+                 include_high: bool = True):
+        self.field = field
+        self.low = low
+        self.high = high
+        self.include_low = include_low
+        self.include_high = include_high
+
+    def bitmap(self, store):
+        column = store.column(self.field)
+        if not isinstance(column, NumericColumn):
+            raise TypeError(f"Range needs a numeric attribute, {self.field!r} is categorical")
+        return column.range_bitmap(self.low, self.high, self.include_low, self.include_high, store.size)
+
+class Not(Predicate):
+    def __init__(self, predicate: Predicate):
+        self.predicate = predicate
+
+    def bitmap(self, store):
+        # Inverting also sets the padding bits past the last row; mask them off
+        return np.bitwise_not(self.predicate.bitmap(store)) & store.all_bitmap()
+
+class And(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = predicates
+
+    def bitmap(self, store):
+        if not self.predicates:
+            return store.all_bitmap()
+        result = self.predicates[0].bitmap(store).copy()
+        for predicate in self.predicates[1:]:
+            np.bitwise_and(result, predicate.bitmap(store), out=result)
+        return result
+
+class Or(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = predicates
+
+    def bitmap(self, store):
+        result = np.zeros((store.size + 7) // 8, dtype=np.uint8)
+        for predicate in self.predicates:
+            np.bitwise_or(result, predicate.bitmap(store), out=result)
+        return result
+
+def criteria_predicate(criteria: Dict) -> Predicate:
+    """Equality criteria dict (as used by segment_audience) as a predicate"""
+    return And(*(Eq(field, value) for field, value in criteria.items()))
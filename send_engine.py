@@ -0,0 +1,241 @@
+"""
+SMTP send pipeline for approved campaign emails.
+
+Messages go out over a pool of persistent SMTP connections, each reused
+for up to SMTP_MESSAGES_PER_CONNECTION messages, with at most
+SMTP_POOL_SIZE sends in flight. Suppressed recipients are skipped,
+per-message results are written to send_results in batches, and every
+delivery is counted as a "sent" tracking event.
+
+    engine = SendEngine()
+    summary = engine.send_campaign_email(user_id, campaign_id, 1, recipients)
+"""
+import os
+import queue
+import smtplib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import Message
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from database import approved_emails, send_results
+from email_utils import EMAIL_TEMPLATE, EMAIL_TEMPLATE_DEFAULTS, normalize_email
+from suppression import get_suppression_index
+from templates import compile_template
+from tracking import click_url, get_event_buffer, make_tracking_token, open_pixel_url
+
+# Load environment variables
+load_dotenv()
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "8"))
+SMTP_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MESSAGES_PER_CONNECTION", "100"))
+SMTP_FROM_ADDRESS = os.getenv("SMTP_FROM_ADDRESS", "campaigns@localhost")
+SEND_RESULT_BATCH = int(os.getenv("SEND_RESULT_BATCH", "500"))
+
+class SMTPConnectionPool:
+    """
+    Up to size persistent SMTP connections. A connection is retired after
+    messages_per_connection messages or on any protocol error.
+    """
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, size: int = SMTP_POOL_SIZE,
+                 messages_per_connection: int = SMTP_MESSAGES_PER_CONNECTION,
+                 username: Optional[str] = SMTP_USERNAME, password: Optional[str] = SMTP_PASSWORD,
+                 starttls: bool = SMTP_STARTTLS, timeout: float = SMTP_TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.messages_per_connection = messages_per_connection
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {"connections_opened": 0, "messages_sent": 0, "errors": 0}
+
+    def _connect(self) -> Dict:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        # Commands and DATA go out as several small writes; without this each
+        # message can stall on Nagle plus delayed ACK
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        with self._lock:
+            self.stats["connections_opened"] += 1
+        return {"smtp": connection, "sent": 0}
+
+    def send(self, message: Message):
+        """Send one message on a pooled connection, reconnecting once if it went stale"""
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                try:
+                    connection["smtp"].send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    # Idle connections may have been closed by the server
+                    connection = self._connect()
+                    connection["smtp"].send_message(message)
+            except Exception:
+                with self._lock:
+                    self.stats["errors"] += 1
+                self._close(connection)
+                raise
+            connection["sent"] += 1
+            with self._lock:
+                self.stats["messages_sent"] += 1
+            if connection["sent"] >= self.messages_per_connection:
+                self._close(connection)
+            else:
+                self._idle.put(connection)
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def _close(connection: Dict):
+        try:
+            connection["smtp"].quit()
+        except Exception:
+            connection["smtp"].close()
+
+class ResultWriter:
+    """Buffers per-message results and inserts them in batches"""
+
+    def __init__(self, collection, batch_size: int = SEND_RESULT_BATCH):
+        self.collection = collection
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, result: Dict):
+        with self._lock:
+            self._pending.append(result)
+            batch = self._pending if len(self._pending) >= self.batch_size else None
+            if batch:
+                self._pending = []
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: List[Dict]):
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            print(f"Error writing {len(batch)} send results: {e}")
+
+class SendEngine:
+    def __init__(self, pool: Optional[SMTPConnectionPool] = None, from_address: str = SMTP_FROM_ADDRESS,
+                 results_collection=None, event_buffer=None):
+        self.pool = pool or SMTPConnectionPool()
+        self.from_address = from_address
+        self.results_collection = results_collection if results_collection is not None else send_results
+        self.event_buffer = event_buffer
+
+    def send_campaign_email(self, user_id: str, campaign_id: str, email_number: int,
+                            recipients: Iterable[Dict], cta_link: str = "#") -> Dict:
+        """
+        Send one approved email of a campaign to recipients (dicts with an
+        "email" key plus any merge fields). Returns counts and elapsed time.
+        Merge fields are only reachable as {{ recipient.<field> }}, so
+        subscriber data can never replace the campaign's own fields.
+        """
+        email = approved_emails.find_one({"campaign_id": campaign_id, "email_number": email_number})
+        if not email:
+            raise ValueError(f"Email {email_number} of campaign {campaign_id} is not approved")
+        return self.send_email(user_id, campaign_id, email_number, email, recipients, cta_link)
+
+    def send_email(self, user_id: str, campaign_id: str, email_number: int, email: Dict,
+                   recipients: Iterable[Dict], cta_link: str = "#") -> Dict:
+        """Send an email document (subject and content) to recipients"""
+        recipients = list(recipients)
+        suppressed = get_suppression_index(user_id).contains_many(r["email"] for r in recipients) \
+            if recipients else []
+        deliverable = [r for r, skip in zip(recipients, suppressed) if not skip]
+
+        token = make_tracking_token(user_id, campaign_id, email_number)
+        subject = email["subject"].replace("Subject:", "").strip()
+        shared = {
+            "subject": subject,
+            "headline": subject,
+            "body": compile_template("{{ content|nl2br }}").render({"content": email["content"]}),
+            "cta_link": click_url(token, cta_link) if cta_link != "#" else cta_link,
+            "tracking_pixel": f'<img src="{open_pixel_url(token)}" width="1" height="1" alt="">'
+        }
+        bodies = compile_template(EMAIL_TEMPLATE).render_batch(
+            ({"recipient": recipient} for recipient in deliverable), shared, EMAIL_TEMPLATE_DEFAULTS
+        )
+
+        writer = ResultWriter(self.results_collection)
+        event_buffer = self.event_buffer or get_event_buffer()
+        counts = {"sent": 0, "failed": 0, "suppressed": len(recipients) - len(deliverable)}
+        counts_lock = threading.Lock()
+
+        # The legacy MIME classes build several times faster than EmailMessage,
+        # and the plain-text part is the same for every recipient
+        text_part = MIMEText(email["content"], "plain", "utf-8")
+
+        def send(recipient: Dict, html: str):
+            message = MIMEMultipart("alternative")
+            message["Subject"] = subject
+            message["From"] = self.from_address
+            message["To"] = recipient["email"]
+            message.attach(text_part)
+            message.attach(MIMEText(html, "html", "utf-8"))
+            result = {
+                "user_id": user_id,
+                "campaign_id": campaign_id,
+                "email_number": email_number,
+                "email": normalize_email(recipient["email"]),
+                "sent_at": datetime.utcnow()
+            }
+            try:
+                self.pool.send(message)
+                result["status"] = "sent"
+            except Exception as e:
+                result.update({"status": "failed", "error": str(e)})
+            writer.add(result)
+            with counts_lock:
+                counts[result["status"]] += 1
+            if result["status"] == "sent":
+                event_buffer.record(user_id, campaign_id, email_number, "sent")
+
+        started = time.perf_counter()
+        # Bounded submission keeps at most a few messages per worker in memory
+        in_flight = threading.BoundedSemaphore(self.pool.size * 4)
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            for recipient, html in zip(deliverable, bodies):
+                in_flight.acquire()
+                future = executor.submit(send, recipient, html)
+                future.add_done_callback(lambda _: in_flight.release())
+        writer.flush()
+        return {**counts, "elapsed_seconds": time.perf_counter() - started}
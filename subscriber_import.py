@@ -0,0 +1,178 @@
+"""
+Streaming subscriber import for CSV and JSONL files.
+
+Rows are read in chunks so memory stays bounded regardless of file size.
+Each chunk is validated with the precompiled EMAIL_PATTERN, addresses are
+normalized and deduplicated against a compact 64-bit hash set, and valid
+rows are written with unordered insert_many batches. Rejected rows go to
+a separate JSONL file with the reason.
+
+    python subscriber_import.py subscribers.csv --list-id <list_id> --rejects rejects.jsonl
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from database import subscribers
+from email_utils import EMAIL_PATTERN, email_hash64, normalize_email
+from hashset64 import HashSet64
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "10000"))
+IMPORT_INSERT_BATCH = int(os.getenv("IMPORT_INSERT_BATCH", "1000"))
+
+class _ByteCountingLines:
+    """
+    Iterate a binary file as decoded lines while counting bytes read.
+    Bytes that are not valid UTF-8 are kept as surrogates so one bad line
+    can be rejected without ending the import.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def __iter__(self):
+        for raw in self._f:
+            self.bytes_read += len(raw)
+            yield raw.decode("utf-8-sig" if self.bytes_read == len(raw) else "utf-8", "surrogateescape")
+
+def _is_valid_utf8(text: str) -> bool:
+    try:
+        text.encode("utf-8")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def _read_rows(lines: _ByteCountingLines, path: str) -> Iterator[Dict]:
+    """Parsed rows; anything that is not a row object comes back as {"__invalid__": ...}"""
+    if path.endswith(".csv"):
+        for row in csv.DictReader(lines):
+            fields = [text for item in row.items() for text in item if isinstance(text, str)]
+            yield row if all(_is_valid_utf8(text) for text in fields) else {"__invalid__": row}
+    else:
+        for line in lines:
+            if line.strip():
+                try:
+                    row = json.loads(line) if _is_valid_utf8(line) else None
+                except ValueError:
+                    row = None
+                yield row if isinstance(row, dict) else {"__invalid__": line.rstrip("\n")}
+
+def _chunks(rows: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class SubscriberImport:
+    """One import run; stats are updated after every chunk"""
+
+    def __init__(self, path: str, list_id: str, rejects_path: Optional[str] = None,
+                 chunk_rows: int = IMPORT_CHUNK_ROWS, insert_batch: int = IMPORT_INSERT_BATCH,
+                 progress_callback: Optional[Callable[[Dict], None]] = None):
+        self.path = path
+        self.list_id = list_id
+        self.rejects_path = rejects_path or f"{path}.rejects.jsonl"
+        self.chunk_rows = chunk_rows
+        self.insert_batch = insert_batch
+        self.progress_callback = progress_callback
+        self.seen = HashSet64()
+        self.stats = {
+            "rows": 0, "valid": 0, "rejected": 0, "duplicates": 0, "inserted": 0,
+            "already_subscribed": 0, "bytes_read": 0, "total_bytes": os.path.getsize(path),
+            "elapsed_seconds": 0.0, "rows_per_second": 0.0, "percent": 0.0
+        }
+
+    def run(self) -> Dict:
+        started = time.perf_counter()
+        with open(self.path, "rb") as f, open(self.rejects_path, "w", encoding="utf-8") as rejects:
+            lines = _ByteCountingLines(f)
+            for chunk in _chunks(_read_rows(lines, self.path), self.chunk_rows):
+                self._import_chunk(chunk, rejects)
+                elapsed = time.perf_counter() - started
+                self.stats.update({
+                    "bytes_read": lines.bytes_read,
+                    "elapsed_seconds": elapsed,
+                    "rows_per_second": self.stats["rows"] / elapsed if elapsed else 0.0,
+                    "percent": 100.0 * lines.bytes_read / self.stats["total_bytes"]
+                    if self.stats["total_bytes"] else 100.0
+                })
+                if self.progress_callback:
+                    self.progress_callback(dict(self.stats))
+        return self.stats
+
+    def _import_chunk(self, chunk: List[Dict], rejects: io.TextIOBase):
+        self.stats["rows"] += len(chunk)
+        documents = []
+        hashes = []
+        now = datetime.utcnow()
+        for row in chunk:
+            email = row.get("email") if "__invalid__" not in row else None
+            if not isinstance(email, str) or not EMAIL_PATTERN.match(normalize_email(email)):
+                reason = "unparseable row" if "__invalid__" in row else "invalid email"
+                rejects.write(json.dumps({"reason": reason, "row": row}, default=str) + "\n")
+                self.stats["rejected"] += 1
+                continue
+            email = normalize_email(email)
+            documents.append({
+                **{key: value for key, value in row.items() if key and key != "email"},
+                "list_id": self.list_id,
+                "email": email,
+                "imported_at": now
+            })
+            hashes.append(email_hash64(email))
+
+        is_new = self.seen.add_many(hashes) if hashes else []
+        unique_documents = [document for document, new in zip(documents, is_new) if new]
+        self.stats["duplicates"] += len(documents) - len(unique_documents)
+        self.stats["valid"] += len(unique_documents)
+
+        for start in range(0, len(unique_documents), self.insert_batch):
+            self._insert(unique_documents[start:start + self.insert_batch])
+
+    def _insert(self, batch: List[Dict]):
+        try:
+            self.stats["inserted"] += len(subscribers.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            # Addresses already on the list hit the unique (list_id, email) index
+            already = sum(1 for error in errors if error["code"] == 11000)
+            self.stats["already_subscribed"] += already
+            self.stats["inserted"] += e.details.get("nInserted", 0)
+            for error in errors:
+                if error["code"] != 11000:
+                    print(f"Error inserting subscriber {batch[error['index']]['email']}: {error['errmsg']}")
+
+def import_subscribers(path: str, list_id: str, rejects_path: Optional[str] = None,
+                       progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Import a CSV or JSONL subscriber file into a list and return the final stats"""
+    return SubscriberImport(path, list_id, rejects_path, progress_callback=progress_callback).run()
+
+def main():
+    parser = argparse.ArgumentParser(description="Import subscribers from CSV or JSONL")
+    parser.add_argument("path", help="Subscriber file (.csv or .jsonl) with an email column")
+    parser.add_argument("--list-id", required=True, help="List the subscribers are added to")
+    parser.add_argument("--rejects", help="Rejected rows output (default: <path>.rejects.jsonl)")
+    args = parser.parse_args()
+
+    def progress(stats):
+        print(f"{stats['percent']:5.1f}%  {stats['rows']} rows  {stats['inserted']} inserted  "
+              f"{stats['rejected']} rejected  {stats['duplicates']} duplicates  "
+              f"{stats['rows_per_second']:.0f} rows/s")
+
+    stats = import_subscribers(args.path, args.list_id, args.rejects, progress)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Suppression index (unsubscribes, bounces, complaints) per tenant.
+
+Addresses are stored as 64-bit hashes of their normalized form in a
+sorted .npy file that is memory-mapped read-only, so any number of worker
+processes share one copy through the page cache. Incremental adds are
+appended to a small delta file; compact() merges it into a new sorted
+file and swaps it in atomically. Lookups are exact up to 64-bit hash
+collisions (about n / 2**64 false positives per address).
+
+    index = get_suppression_index(tenant_id)
+    index.add_many(["user@example.com"])
+    suppressed = index.contains_many(emails)
+"""
+import fcntl
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from email_utils import email_hash64, normalize_email
+from segmentation import NumericColumn, Predicate
+
+SUPPRESSION_DIR = os.getenv("SUPPRESSION_DIR", "suppression")
+# Merge the delta into the base file once it holds this many hashes
+SUPPRESSION_COMPACT_THRESHOLD = int(os.getenv("SUPPRESSION_COMPACT_THRESHOLD", "100000"))
+
+def hash_emails(emails: Iterable[str]) -> np.ndarray:
+    """Hash addresses the same way the index stores them"""
+    return np.fromiter((email_hash64(normalize_email(email)) for email in emails), dtype=np.uint64)
+
+class SuppressionIndex:
+    """Sorted, memory-mapped uint64 hash array plus an append-only delta"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.base_path = os.path.join(directory, "suppressed.npy")
+        self.delta_path = os.path.join(directory, "suppressed.delta")
+        self.lock_path = os.path.join(directory, "suppressed.lock")
+        self._base = np.zeros(0, dtype=np.uint64)
+        self._base_stamp = None
+        self._delta = np.zeros(0, dtype=np.uint64)
+        self._delta_size = 0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self):
+        return len(self._base) + len(self._delta)
+
+    def refresh(self):
+        """
+        Pick up a newly compacted base file and delta appends from other
+        processes. Costs two stat calls when nothing changed.
+        """
+        with self._lock:
+            if not self._changed():
+                return
+            with open(self.lock_path, "a") as lock:
+                # Writers hold LOCK_EX while appending or compacting
+                fcntl.flock(lock, fcntl.LOCK_SH)
+                self._refresh()
+
+    def _base_file_stamp(self):
+        try:
+            stat = os.stat(self.base_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _delta_file_size(self) -> int:
+        try:
+            size = os.path.getsize(self.delta_path)
+        except FileNotFoundError:
+            return 0
+        # Only whole hashes; a concurrent append may be half written
+        return size - size % 8
+
+    def _changed(self) -> bool:
+        return self._base_file_stamp() != self._base_stamp or self._delta_file_size() != self._delta_size
+
+    def _refresh(self):
+        # Caller holds self._lock and a shared or exclusive flock
+        stamp = self._base_file_stamp()
+        if stamp is not None:
+            if stamp != self._base_stamp:
+                self._base = np.load(self.base_path, mmap_mode="r")
+                self._base_stamp = stamp
+                # The delta file was truncated when this base was written
+                self._delta = np.zeros(0, dtype=np.uint64)
+                self._delta_size = 0
+        size = self._delta_file_size()
+        if size < self._delta_size:
+            self._delta = np.zeros(0, dtype=np.uint64)
+            self._delta_size = 0
+        if size > self._delta_size:
+            with open(self.delta_path, "rb") as f:
+                f.seek(self._delta_size)
+                added = np.frombuffer(f.read(size - self._delta_size), dtype="<u8")
+            self._delta = np.union1d(self._delta, added.astype(np.uint64))
+            self._delta_size = size
+
+    def add_many(self, emails: Iterable[str]):
+        """Suppress addresses"""
+        self.add_hashes(hash_emails(emails))
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Suppress already-hashed addresses"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes):
+            return
+        with self._lock, open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.delta_path, "ab") as f:
+                f.write(hashes.astype("<u8").tobytes())
+            self._refresh()
+            if len(self._delta) >= SUPPRESSION_COMPACT_THRESHOLD:
+                self._compact()
+
+    def contains_many(self, emails: Iterable[str]) -> np.ndarray:
+        """Vectorized membership check; True where an address is suppressed"""
+        return self.contains_hashes(hash_emails(emails))
+
+    def contains_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        """Vectorized membership check for hashes from hash_emails"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        # Long-lived senders must see unsubscribes added by other processes
+        self.refresh()
+        with self._lock:
+            base, delta = self._base, self._delta
+        return _sorted_contains(base, hashes) | _sorted_contains(delta, hashes)
+
+    def compact(self):
+        """Merge the delta into a new base file"""
+        with self._lock, open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        # Caller holds both locks
+        merged = np.union1d(np.asarray(self._base), self._delta)
+        temp_path = f"{self.base_path}.tmp.npy"
+        np.save(temp_path, merged)
+        os.replace(temp_path, self.base_path)
+        open(self.delta_path, "wb").close()
+        self._base_stamp = None
+        self._refresh()
+
+def _sorted_contains(sorted_hashes: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    if not len(sorted_hashes):
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.searchsorted(sorted_hashes, hashes)
+    positions[positions == len(sorted_hashes)] = 0
+    return sorted_hashes[positions] == hashes
+
+class Suppressed(Predicate):
+    """
+    Segmentation predicate matching rows whose hash column (values from
+    hash_emails) is in a suppression index; use ~Suppressed(...) to exclude.
+    """
+
+    def __init__(self, hash_field: str, index: SuppressionIndex):
+        self.hash_field = hash_field
+        self.index = index
+
+    def bitmap(self, store):
+        column = store.column(self.hash_field)
+        if not isinstance(column, NumericColumn):
+            raise TypeError(f"{self.hash_field!r} must be a uint64 hash column")
+        return np.packbits(self.index.contains_hashes(column.values))
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_suppression_index(tenant_id: str) -> SuppressionIndex:
+    """Return the process-wide suppression index of a tenant"""
+    with _indexes_lock:
+        if tenant_id not in _indexes:
+            _indexes[tenant_id] = SuppressionIndex(os.path.join(SUPPRESSION_DIR, str(tenant_id)))
+        return _indexes[tenant_id]
@@ -0,0 +1,128 @@
+"""
+Compiled email templates with per-recipient merge fields.
+
+A layout is compiled once into alternating literal segments and field
+lookups, and the compiled form is cached by source. Merge fields are
+written {{ name }} and HTML-escaped by default; filters change that:
+
+    {{ body|raw }}      inserted as-is (trusted HTML)
+    {{ text|nl2br }}    escaped, newlines become <br>
+    {{ link|url }}      percent-encoded for use inside a URL
+
+render_batch streams one rendered document per recipient. Shared values
+take precedence over recipient values, which take precedence over
+defaults, so imported subscriber columns can never replace campaign
+content; shared values are filtered once per batch rather than once per
+recipient. raw slots are trusted HTML and are never filled from recipient
+data.
+"""
+import re
+from functools import lru_cache
+from html import escape
+from typing import Dict, Iterable, Iterator, Optional
+from urllib.parse import quote
+
+FIELD_PATTERN = re.compile(r"{{\s*([\w.]+)\s*(?:\|\s*(\w+)\s*)?}}")
+
+FILTERS = {
+    "escape": lambda value: escape(str(value)),
+    "raw": str,
+    "nl2br": lambda value: escape(str(value)).replace("\n", "<br>"),
+    "url": lambda value: quote(str(value), safe=""),
+}
+
+class TemplateError(Exception):
+    """Raised for unknown filters or missing merge fields"""
+
+class CompiledTemplate:
+    """A layout split into literal segments and (field, filter) slots"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.literals = []
+        self.fields = []
+        self.raw_slots = set()
+        position = 0
+        for match in FIELD_PATTERN.finditer(source):
+            name, filter_name = match.group(1), match.group(2) or "escape"
+            if filter_name not in FILTERS:
+                raise TemplateError(f"Unknown template filter {filter_name!r}")
+            self.literals.append(source[position:match.start()])
+            self.fields.append((name, FILTERS[filter_name]))
+            if filter_name == "raw":
+                self.raw_slots.add(len(self.fields) - 1)
+            position = match.end()
+        self.literals.append(source[position:])
+        self.field_names = {name for name, _ in self.fields}
+
+    def render(self, context: Dict) -> str:
+        """Render one document from a trusted context"""
+        return next(self.render_batch([{}], context))
+
+    def render_batch(self, recipients: Iterable[Dict], shared: Optional[Dict] = None,
+                     defaults: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Yield one rendered document per recipient. Lookups try shared, then
+        the recipient (except for raw slots), then defaults; a field found
+        in none raises TemplateError.
+        """
+        shared = shared or {}
+        defaults = defaults or {}
+        # Slots whose value is the same for every recipient of this batch are
+        # resolved once; recipient-specific names stay as per-recipient lookups.
+        fixed = {
+            index: apply(_lookup(shared, name))
+            for index, (name, apply) in enumerate(self.fields)
+            if _has(shared, name)
+        }
+        fallback = {
+            index: apply(_lookup(defaults, name))
+            for index, (name, apply) in enumerate(self.fields)
+            if index not in fixed and _has(defaults, name)
+        }
+        literals = self.literals
+        fields = self.fields
+        raw_slots = self.raw_slots
+        for recipient in recipients:
+            parts = [literals[0]]
+            for index, (name, apply) in enumerate(fields):
+                if index in fixed:
+                    parts.append(fixed[index])
+                elif index not in raw_slots and _has(recipient, name):
+                    parts.append(apply(_lookup(recipient, name)))
+                elif index in fallback:
+                    parts.append(fallback[index])
+                else:
+                    raise TemplateError(f"Missing merge field {name!r}")
+                parts.append(literals[index + 1])
+            yield "".join(parts)
+
+def _has(context: Dict, name: str) -> bool:
+    if name in context:
+        return True
+    if "." not in name:
+        return False
+    value = context
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+def _lookup(context: Dict, name: str):
+    if name in context:
+        return context[name]
+    value = context
+    for part in name.split("."):
+        value = value[part]
+    return value
+
+@lru_cache(maxsize=256)
+def compile_template(source: str) -> CompiledTemplate:
+    """Compile a layout, reusing the compiled form for identical sources"""
+    return CompiledTemplate(source)
+
+def render_batch(source: str, recipients: Iterable[Dict], shared: Optional[Dict] = None,
+                 defaults: Optional[Dict] = None) -> Iterator[str]:
+    """Compile (cached) and stream personalized renders of a layout"""
+    return compile_template(source).render_batch(recipients, shared, defaults)
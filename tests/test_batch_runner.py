@@ -0,0 +1,38 @@
+import json
+
+from batch_runner import CAMPAIGN_FIELDS, read_campaign_specs, run_batch, spec_key
+
+def _spec(name, **overrides):
+    spec = {field: "x" for field in CAMPAIGN_FIELDS}
+    spec.update({"campaign_name": name, "timeline": "4", "num_emails": 3, **overrides})
+    return spec
+
+def _write_specs(tmp_path, lines):
+    path = tmp_path / "campaigns.jsonl"
+    path.write_text("".join(line + "\n" for line in lines))
+    return str(path)
+
+def test_bad_specs_are_reported_individually(tmp_path):
+    path = _write_specs(tmp_path, [
+        json.dumps(_spec("ok")),
+        json.dumps(_spec("no timeline", timeline="")),
+        json.dumps(_spec("fractional", timeline="2.5")),
+        "null",
+        "{broken",
+        json.dumps(_spec("also ok")),
+    ])
+    specs = list(read_campaign_specs(path))
+    assert [spec["campaign_name"] for _, spec, _ in specs if spec] == ["ok", "also ok"]
+    assert specs[0][1]["timeline"] == 4
+    assert [number for number, spec, _ in specs if spec is None] == [2, 3, 4, 5]
+
+def test_skipped_counts_only_completed_specs_in_this_input(tmp_path):
+    path = _write_specs(tmp_path, [json.dumps(_spec("done")), json.dumps(_spec("bad", num_emails="many"))])
+    progress = tmp_path / "progress.jsonl"
+    progress.write_text("".join(
+        json.dumps({"key": spec_key("user", {"campaign_name": name})}) + "\n" for name in ("done", "other", "more")
+    ))
+    summary = run_batch(path, "user", progress_path=str(progress))
+    assert summary["skipped"] == 1
+    assert summary["generated"] == 0
+    assert [rejected["line"] for rejected in summary["rejected"]] == [2]
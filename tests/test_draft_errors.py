@@ -0,0 +1,66 @@
+import pytest
+
+import llm_cache
+from email_marketing_team import run_email_marketing_team
+from llm_backends import LLMBackendError, LLMQuotaError, StubBackend
+from llm_cache import LLMResponseCache
+
+TASK = "Campaign Name: Test\nNumber of Emails: 2\n"
+
+class FailingDraftBackend(StubBackend):
+    """Stub whose per-email draft calls raise error"""
+
+    def __init__(self, error: Exception):
+        super().__init__()
+        self.error = error
+
+    def generate(self, prompt: str) -> str:
+        if "Write email" in prompt:
+            raise self.error
+        return super().generate(prompt)
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_response_cache", LLMResponseCache(str(tmp_path / "cache.sqlite3")))
+
+def test_quota_errors_in_draft_threads_are_raised():
+    backend = FailingDraftBackend(RuntimeError("429 quota exceeded"))
+    with pytest.raises(LLMQuotaError):
+        run_email_marketing_team(TASK, max_retries=0, backend=backend, draft_mode="per_email")
+
+def test_other_draft_errors_become_placeholders_with_the_real_attempt_count(capsys):
+    backend = FailingDraftBackend(ValueError("bad prompt"))
+    results = run_email_marketing_team(TASK, max_retries=3, backend=backend, draft_mode="per_email")
+    assert results["failed_drafts"] == [1, 2]
+    assert "Draft 1 unavailable" in results["email_drafts"][0]
+    assert "failed after 1 attempt: bad prompt" in capsys.readouterr().out
+
+class BriefFailingBackend(StubBackend):
+    """Stub whose strategy brief call fails or returns no JSON, recording draft prompts"""
+
+    def __init__(self, brief_error: Exception = None):
+        super().__init__()
+        self.brief_error = brief_error
+        self.draft_prompts = []
+
+    def generate(self, prompt: str) -> str:
+        if "STRATEGY BRIEF JSON" in prompt:
+            if self.brief_error:
+                raise self.brief_error
+            return "Sorry, no brief today."
+        if "Write email" in prompt:
+            self.draft_prompts.append(prompt)
+        return super().generate(prompt)
+
+    def stream(self, prompt: str):
+        # Longer than any prompt budget, with the sequence plan at the end
+        yield "Strategy overview. " * 200 + "Email 2 closes with the launch offer."
+
+@pytest.mark.parametrize("brief_error", [None, LLMBackendError("provider unavailable")])
+def test_drafts_use_the_full_strategy_when_the_brief_is_unavailable(brief_error):
+    backend = BriefFailingBackend(brief_error)
+    results = run_email_marketing_team(TASK, max_retries=0, backend=backend, draft_mode="per_email")
+    assert results["strategy_brief"] is None
+    assert results["failed_drafts"] == []
+    assert len(backend.draft_prompts) == 2
+    assert all(results["strategy"] in prompt for prompt in backend.draft_prompts)
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from email_marketing_team import parse_email_batch, parse_strategy_brief
+
+def _draft(number, subject="Subject"):
+    return {"email_number": number, "subject": subject, "body": "Body", "cta": "Buy"}
+
+def test_batch_is_read_from_surrounding_prose_and_fences():
+    text = f"Here you go:\n```json\n{json.dumps([_draft(1), _draft(2)])}\n```\nNote: see [1]."
+    drafts, invalid = parse_email_batch(text, 2)
+    assert sorted(drafts) == [1, 2] and invalid == []
+    assert drafts[1] == {"subject": "Subject", "body": "Body", "cta": "Buy"}
+
+def test_brackets_before_the_array_are_skipped():
+    drafts, invalid = parse_email_batch(f"[draft batch] {json.dumps([_draft(1)])}", 1)
+    assert list(drafts) == [1] and invalid == []
+
+def test_missing_malformed_and_duplicate_drafts_are_invalid():
+    items = [_draft(1), _draft(1, "Again"), _draft(2, " "), _draft(True), _draft(4), "text"]
+    drafts, invalid = parse_email_batch(json.dumps(items), 3)
+    assert drafts[1]["subject"] == "Subject"
+    assert invalid == [2, 3]
+
+def test_unparseable_batch_leaves_every_number_invalid():
+    assert parse_email_batch("no json here", 2) == ({}, [1, 2])
+    assert parse_email_batch('[{"email_number": 1,', 2) == ({}, [1, 2])
+
+def test_brief_stops_at_the_end_of_the_object():
+    brief = {"objective": "Sell", "emails": [{"email_number": 1, "focus": "Intro"}]}
+    assert parse_strategy_brief(f"```json\n{json.dumps(brief)}\n```\nUse {{name}} in the greeting.") == brief
+
+def test_brief_without_an_object_raises():
+    with pytest.raises(ValueError):
+        parse_strategy_brief("no brief")
+    with pytest.raises(ValueError):
+        parse_strategy_brief('{"emails": "none"}')
@@ -0,0 +1,28 @@
+from indexes import INDEXES
+
+# Indexes created by earlier releases, which existing deployments still
+# have under these (default generated) names
+BASELINE_INDEXES = {
+    "users": {"email_1": [("email", 1)]},
+    "campaigns": {
+        "user_id_1_campaign_name_1": [("user_id", 1), ("campaign_name", 1)],
+        "user_id_1": [("user_id", 1)],
+    },
+}
+
+def _declared(collection):
+    return {model.document["name"]: list(model.document["key"].items()) for model in INDEXES[collection]}
+
+def test_baseline_key_patterns_keep_their_names():
+    for collection, baseline in BASELINE_INDEXES.items():
+        declared = _declared(collection)
+        for name, keys in baseline.items():
+            for declared_name, declared_keys in declared.items():
+                if declared_keys == keys:
+                    assert declared_name == name, f"{collection} {keys} must keep the name {name}"
+
+def test_no_collection_declares_the_same_keys_twice():
+    for collection, models in INDEXES.items():
+        keys = [tuple(model.document["key"].items()) for model in models]
+        assert len(keys) == len(set(keys)), collection
+        assert len(_declared(collection)) == len(models), collection
@@ -0,0 +1,26 @@
+import itertools
+
+import llm_cache
+from llm_cache import LLMResponseCache
+
+def test_memory_hits_keep_an_entry_from_being_evicted(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(llm_cache.time, "time", lambda: float(next(clock)))
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "response a")
+    cache.set("b", "response b")
+    assert cache.get("a") == "response a"
+    cache.set("c", "response c")
+
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == "response a"
+    assert cache.get("c") == "response c"
+    assert cache.stats()["entries"] == 2
+
+def test_evicted_entries_leave_memory_too(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=1)
+    cache.set("a", "response a")
+    cache.set("b", "response b")
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.get("a") is None
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from indexes import check_query_plans, ensure_indexes, query_calls, record_queries
+
+TEST_DB_NAME = "email_marketing_query_plan_test"
+
+@pytest.fixture(scope="module")
+def db():
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("no MongoDB server reachable")
+    client.drop_database(TEST_DB_NAME)
+    yield client[TEST_DB_NAME]
+    client.drop_database(TEST_DB_NAME)
+    client.close()
+
+def test_every_query_path_issues_a_query():
+    for name, call, documents in query_calls():
+        assert record_queries(call, documents), name
+
+def test_every_query_uses_an_index(db):
+    ensure_indexes(db)
+    assert check_query_plans(db) == []
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+from scheduler import TimerWheel, send_times
+
+def test_timer_wheel_fires_due_items_once():
+    wheel = TimerWheel(now=1000)
+    assert wheel.add(1002, "a")
+    assert not wheel.add(1002, "a")
+    wheel.add(999, "overdue")
+    assert wheel.advance(1000) == [("overdue", None)]
+    assert wheel.advance(1001) == []
+    assert wheel.advance(1003) == [("a", None)]
+    assert len(wheel) == 0
+
+def test_timer_wheel_keeps_items_beyond_one_revolution():
+    wheel = TimerWheel(slots=8, now=0)
+    wheel.add(3, "near")
+    wheel.add(3 + 8 * 5, "far")
+    assert wheel.advance(4) == [("near", None)]
+    assert wheel.advance(20) == []
+    assert wheel.advance(100) == [("far", None)]
+
+def test_timer_wheel_catches_up_after_a_long_pause():
+    wheel = TimerWheel(slots=8, now=0)
+    for due in range(0, 30, 3):
+        wheel.add(due, due)
+    assert sorted(key for key, _ in wheel.advance(1000)) == list(range(0, 30, 3))
+
+def test_send_times_follow_frequency_within_timeline():
+    start = datetime(2026, 1, 1)
+    assert send_times(start, 3, 4, "Weekly") == [start, start + timedelta(weeks=1), start + timedelta(weeks=2)]
+
+def test_send_times_are_squeezed_into_the_timeline():
+    start = datetime(2026, 1, 1)
+    times = send_times(start, 5, 2, "Weekly")
+    assert times[0] == start and times[-1] == start + timedelta(weeks=2)
+    assert len(set(b - a for a, b in zip(times, times[1:]))) == 1
+
+def test_single_email_is_sent_at_start():
+    assert send_times(datetime(2026, 1, 1), 1, 1, "Monthly") == [datetime(2026, 1, 1)]
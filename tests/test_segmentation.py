@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from email_utils import EmailMarketingUtils
+from segmentation import And, Eq, In, Not, Or, Range, SubscriberStore
+
+# Not a multiple of 8, so the packed bitmaps have padding bits
+SIZE = 203
+
+@pytest.fixture
+def columns():
+    rng = np.random.default_rng(7)
+    scores = rng.normal(50, 20, SIZE)
+    scores[rng.random(SIZE) < 0.1] = np.nan
+    return {
+        "country": rng.choice(["DE", "AT", "CH", "FR"], SIZE),
+        "age": rng.integers(16, 80, SIZE),
+        "score": scores,
+    }
+
+@pytest.fixture
+def store(columns):
+    return SubscriberStore.from_columns(columns)
+
+def _check(store, predicate, mask):
+    assert store.select(predicate).tolist() == np.flatnonzero(mask).tolist()
+    assert store.count(predicate) == int(mask.sum())
+
+def test_eq_and_in_match_brute_force(store, columns):
+    _check(store, Eq("country", "DE"), columns["country"] == "DE")
+    _check(store, Eq("country", "XX"), np.zeros(SIZE, dtype=bool))
+    _check(store, Eq("age", 30), columns["age"] == 30)
+    _check(store, In("country", ["AT", "CH"]), np.isin(columns["country"], ["AT", "CH"]))
+
+def test_range_bounds_match_brute_force(store, columns):
+    age = columns["age"]
+    _check(store, Range("age", 18, 34), (age >= 18) & (age <= 34))
+    _check(store, Range("age", 18, 34, include_low=False, include_high=False), (age > 18) & (age < 34))
+    _check(store, Range("age", low=65), age >= 65)
+    _check(store, Range("age", high=20, include_high=False), age < 20)
+
+def test_nan_is_never_in_a_range(store, columns):
+    score = columns["score"]
+    with np.errstate(invalid="ignore"):
+        _check(store, Range("score", 40, 60), (score >= 40) & (score <= 60))
+        _check(store, Range("score", low=0), score >= 0)
+    _check(store, Range("score"), ~np.isnan(score))
+    _check(store, Eq("score", np.nan), np.zeros(SIZE, dtype=bool))
+
+def test_not_masks_padding_bits(store, columns):
+    _check(store, Not(Eq("country", "DE")), columns["country"] != "DE")
+    _check(store, ~Eq("country", "XX"), np.ones(SIZE, dtype=bool))
+    assert len(store.select(Not(Eq("country", "XX")))) == SIZE
+
+def test_combined_predicates_match_brute_force(store, columns):
+    country, age = columns["country"], columns["age"]
+    predicate = (Eq("country", "DE") | Eq("country", "AT")) & ~Range("age", 18, 34)
+    _check(store, predicate, np.isin(country, ["DE", "AT"]) & ~((age >= 18) & (age <= 34)))
+    _check(store, And(), np.ones(SIZE, dtype=bool))
+    _check(store, Or(), np.zeros(SIZE, dtype=bool))
+
+def test_range_on_a_categorical_column_raises(store):
+    with pytest.raises(TypeError):
+        store.select(Range("country", "A", "D"))
+
+def _legacy_segment(subscribers, criteria):
+    return [s for s in subscribers if all(s.get(key) == value for key, value in criteria.items())]
+
+SUBSCRIBERS = [
+    {"email": "a@example.com", "plan": "pro", "active": True, "visits": 1},
+    {"email": "b@example.com", "plan": "pro", "active": 1, "visits": 1.0},
+    {"email": "c@example.com", "plan": "free", "active": False},
+    {"email": "d@example.com", "active": True, "visits": 0},
+    {"email": "e@example.com", "plan": None, "active": 0, "visits": True},
+]
+
+@pytest.mark.parametrize("criteria", [
+    {"plan": "pro"},
+    {"active": True},
+    {"active": 1, "plan": "pro"},
+    {"visits": 1},
+    {"visits": True},
+    {"active": False},
+    {"plan": None},
+    {"plan": "enterprise"},
+    {"missing": None},
+    {},
+])
+def test_segment_audience_matches_the_equality_loop(criteria):
+    assert EmailMarketingUtils.segment_audience(SUBSCRIBERS, criteria) == _legacy_segment(SUBSCRIBERS, criteria)
+
+def test_segment_audience_falls_back_for_unhashable_values():
+    subscribers = [{"tags": ["vip"]}, {"tags": ["new"]}, {"tags": ["vip"]}]
+    assert EmailMarketingUtils.segment_audience(subscribers, {"tags": ["vip"]}) == [subscribers[0], subscribers[2]]
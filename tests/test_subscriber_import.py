@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+
+from hashset64 import HashSet64
+from subscriber_import import SubscriberImport
+
+def test_hashset_reports_first_occurrences_as_new():
+    hashes = HashSet64()
+    assert hashes.add_many([5, 7, 5]).tolist() == [True, True, False]
+    assert hashes.add_many([7, 9]).tolist() == [False, True]
+    assert len(hashes) == 3
+    assert hashes.contains_many([5, 9, 11]).tolist() == [True, True, False]
+
+def test_hashset_stores_zero():
+    hashes = HashSet64()
+    assert hashes.add_many([0]).tolist() == [True]
+    assert hashes.contains_many([0]).tolist() == [True]
+
+def test_hashset_grows_past_its_initial_capacity():
+    hashes = HashSet64(capacity=4)
+    values = np.arange(1, 1001, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    assert hashes.add_many(values).all()
+    assert len(hashes) == 1000
+    assert hashes.contains_many(values).all()
+    assert not hashes.add_many(values).any()
+
+def _reasons(tmp_path, name, content: bytes):
+    path = tmp_path / name
+    path.write_bytes(content)
+    rejects = tmp_path / "rejects.jsonl"
+    stats = SubscriberImport(str(path), "list", str(rejects)).run()
+    return stats, [json.loads(line)["reason"] for line in rejects.read_text().splitlines()]
+
+def test_jsonl_rows_that_are_not_objects_are_rejected(tmp_path):
+    content = b'null\n5\n["a@example.com"]\n{not json\n\xff\xfe{"email": "a@example.com"}\n{"email": "nope"}\n'
+    stats, reasons = _reasons(tmp_path, "subscribers.jsonl", content)
+    assert reasons == ["unparseable row"] * 5 + ["invalid email"]
+    assert stats["rows"] == stats["rejected"] == 6
+
+def test_csv_rows_with_invalid_utf8_are_rejected(tmp_path):
+    stats, reasons = _reasons(tmp_path, "subscribers.csv", b"email,name\nbad@example.com,\xff\n,blank\n")
+    assert reasons == ["unparseable row", "invalid email"]
+    assert stats["rejected"] == 2
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+
+from suppression import SuppressionIndex, hash_emails
+
+def test_membership_is_normalized(tmp_path):
+    index = SuppressionIndex(str(tmp_path))
+    index.add_many(["User@Example.com "])
+    assert index.contains_many(["user@example.com", "other@example.com"]).tolist() == [True, False]
+
+def test_other_instances_see_adds_without_explicit_refresh(tmp_path):
+    writer, reader = SuppressionIndex(str(tmp_path)), SuppressionIndex(str(tmp_path))
+    assert not reader.contains_many(["a@example.com"])[0]
+    writer.add_many(["a@example.com"])
+    assert reader.contains_many(["a@example.com"])[0]
+
+def test_compaction_is_picked_up_by_other_instances(tmp_path):
+    writer, reader = SuppressionIndex(str(tmp_path)), SuppressionIndex(str(tmp_path))
+    writer.add_many(["a@example.com"])
+    assert reader.contains_many(["a@example.com"])[0]
+    writer.compact()
+    writer.add_many(["b@example.com"])
+    assert reader.contains_many(["a@example.com", "b@example.com", "c@example.com"]).tolist() == [True, True, False]
+
+def test_half_written_append_is_ignored_until_complete(tmp_path):
+    writer, reader = SuppressionIndex(str(tmp_path)), SuppressionIndex(str(tmp_path))
+    writer.add_many(["a@example.com"])
+    pending = hash_emails(["b@example.com"]).astype("<u8").tobytes()
+    with open(os.path.join(str(tmp_path), "suppressed.delta"), "ab") as f:
+        f.write(pending[:3])
+        f.flush()
+        assert reader.contains_many(["a@example.com", "b@example.com"]).tolist() == [True, False]
+        f.write(pending[3:])
+    assert reader.contains_many(["b@example.com"])[0]
+
+def test_contains_hashes_matches_sorted_lookup(tmp_path):
+    index = SuppressionIndex(str(tmp_path))
+    hashes = np.arange(1, 2000, 2, dtype=np.uint64)
+    index.add_hashes(hashes)
+    index.compact()
+    probe = np.arange(0, 2001, dtype=np.uint64)
+    assert index.contains_hashes(probe).tolist() == (probe % 2 == 1).tolist()
@@ -0,0 +1,50 @@
+import pytest
+
+from email_utils import EMAIL_TEMPLATE, EMAIL_TEMPLATE_DEFAULTS, EmailMarketingUtils
+from templates import TemplateError, compile_template, render_batch
+
+def test_fields_are_escaped_by_default():
+    assert compile_template("<p>{{ name }}</p>").render({"name": "<b>Al</b>"}) == "<p>&lt;b&gt;Al&lt;/b&gt;</p>"
+
+def test_filters():
+    template = compile_template("{{ html|raw }}|{{ text|nl2br }}|{{ link|url }}")
+    assert template.render({"html": "<i>x</i>", "text": "a\n<b>", "link": "a b/c"}) == \
+        "<i>x</i>|a<br>&lt;b&gt;|a%20b%2Fc"
+
+def test_unknown_filter_and_missing_field():
+    with pytest.raises(TemplateError):
+        compile_template("{{ name|upper }}")
+    with pytest.raises(TemplateError):
+        compile_template("{{ name }}").render({})
+
+def test_compiled_templates_are_cached():
+    assert compile_template("{{ a }}") is compile_template("{{ a }}")
+
+def test_batch_lookup_order_is_shared_then_recipient_then_defaults():
+    rendered = list(render_batch(
+        "{{ subject }} {{ recipient.name }} {{ cta }}",
+        [{"subject": "EVIL", "recipient": {"name": "Ann"}, "cta": "mine"}, {"recipient": {"name": "Bo"}}],
+        shared={"subject": "Launch"},
+        defaults={"cta": "default"}
+    ))
+    assert rendered == ["Launch Ann mine", "Launch Bo default"]
+
+def test_raw_slots_never_take_recipient_values():
+    rendered = list(render_batch(
+        "{{ body|raw }}{{ tracking_pixel|raw }}",
+        [{"body": "<script>x</script>", "tracking_pixel": "<script>y</script>"}],
+        defaults={"body": "", "tracking_pixel": ""}
+    ))
+    assert rendered == [""]
+
+def test_email_layout_keeps_campaign_content_over_subscriber_columns():
+    html = next(compile_template(EMAIL_TEMPLATE).render_batch(
+        [{"body": "<script>x</script>", "subject": "EVIL"}],
+        {"subject": "Spring", "body": "<p>Hello</p>"},
+        EMAIL_TEMPLATE_DEFAULTS
+    ))
+    assert "<p>Hello</p>" in html and "<script>" not in html and "EVIL" not in html
+
+def test_generate_html_template_renders_trusted_body():
+    html = EmailMarketingUtils.generate_html_template({"subject": "S", "body": "<p>hi</p>"})
+    assert "<p>hi</p>" in html
@@ -0,0 +1,40 @@
+import time
+
+from auth import TokenCache, create_access_token, token_cache, verify_token
+
+def test_hit_returns_a_copy_of_the_payload():
+    cache = TokenCache()
+    cache.put("token", {"sub": "user", "exp": time.time() + 60})
+    payload = cache.get("token")
+    payload["sub"] = "changed"
+    assert cache.get("token")["sub"] == "user"
+    assert cache.stats()["hits"] == 2
+
+def test_expired_entry_is_dropped():
+    cache = TokenCache()
+    cache.put("token", {"sub": "user", "exp": time.time() - 1})
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+def test_payload_without_exp_is_not_cached():
+    cache = TokenCache()
+    cache.put("token", {"sub": "user"})
+    assert cache.get("token") is None
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 60
+    cache.put("a", {"exp": exp})
+    cache.put("b", {"exp": exp})
+    cache.get("a")
+    cache.put("c", {"exp": exp})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+def test_only_valid_tokens_are_cached():
+    token_cache.invalidate("not-a-token")
+    assert verify_token("not-a-token") is None
+    assert token_cache.get("not-a-token") is None
+    token = create_access_token({"sub": "user"})
+    assert verify_token(token)["sub"] == "user"
+    assert token_cache.get(token)["sub"] == "user"
@@ -0,0 +1,299 @@
+"""
+Engagement tracking: open pixel, click redirect and conversion beacon.
+
+Events are counted in memory and flushed as batched $inc upserts into one
+engagement_hourly document per campaign, email and hour, plus the
+campaign_stats_daily rollups, so storage grows with campaigns x hours
+rather than with the number of events.
+
+    python tracking.py --port 8765
+
+Links are signed with JWT_SECRET_KEY so counts and redirects cannot be
+forged:
+    GET /o/<token>.gif          open pixel
+    GET /c/<token>?url=..&s=..  click, 302 to url
+    GET /v/<token>              conversion
+"""
+import argparse
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, quote, urlparse
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from campaign_metrics import daily_rollup_operation, day_start
+
+# Load environment variables
+load_dotenv()
+
+TRACKING_SECRET = os.getenv("JWT_SECRET_KEY", "your-secret-key").encode()
+TRACKING_BASE_URL = os.getenv("TRACKING_BASE_URL", "http://localhost:8765")
+TRACKING_FLUSH_SECONDS = float(os.getenv("TRACKING_FLUSH_SECONDS", "2"))
+TRACKING_FLUSH_EVENTS = int(os.getenv("TRACKING_FLUSH_EVENTS", "10000"))
+
+# Event type -> counter field
+EVENT_FIELDS = {"sent": "sent", "open": "opens", "click": "clicks", "conversion": "conversions"}
+
+PIXEL_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+def _sign(message: str) -> str:
+    digest = hmac.new(TRACKING_SECRET, message.encode(), hashlib.sha256).digest()[:12]
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+def make_tracking_token(user_id: str, campaign_id: str, email_number: int) -> str:
+    """Signed token identifying the campaign email a link belongs to"""
+    payload = base64.urlsafe_b64encode(
+        json.dumps([user_id, campaign_id, email_number], separators=(",", ":")).encode()
+    ).decode().rstrip("=")
+    return f"{payload}.{_sign(payload)}"
+
+def parse_tracking_token(token: str) -> Optional[Dict]:
+    """Return {"user_id", "campaign_id", "email_number"} or None if the token is invalid"""
+    try:
+        payload, signature = token.split(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        user_id, campaign_id, email_number = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return {"user_id": user_id, "campaign_id": campaign_id, "email_number": email_number}
+    except (ValueError, TypeError):
+        return None
+
+def open_pixel_url(token: str) -> str:
+    return f"{TRACKING_BASE_URL}/o/{token}.gif"
+
+def click_url(token: str, url: str) -> str:
+    """Tracked link that redirects to url"""
+    return f"{TRACKING_BASE_URL}/c/{token}?url={quote(url, safe='')}&s={_sign(token + '|' + url)}"
+
+def conversion_url(token: str) -> str:
+    return f"{TRACKING_BASE_URL}/v/{token}"
+
+class EventBuffer:
+    """
+    Counts events in memory and flushes them as $inc upserts every
+    flush_seconds or once flush_events are pending.
+
+    Failed writes are retried at least once, never dropped. Buckets that
+    the server reports as failed are retried alone. A batch whose outcome
+    is unknown (e.g. the connection dropped mid-write) is retried whole,
+    so some of its increments may be counted twice.
+    """
+
+    def __init__(self, hourly_collection, daily_collection,
+                 flush_seconds: float = TRACKING_FLUSH_SECONDS,
+                 flush_events: int = TRACKING_FLUSH_EVENTS):
+        self.hourly_collection = hourly_collection
+        self.daily_collection = daily_collection
+        self.flush_seconds = flush_seconds
+        self.flush_events = flush_events
+        self._counts = Counter()
+        # Buckets whose last write failed, kept per collection so a retry
+        # only re-applies what was not written
+        self._hourly_retry = {}
+        self._daily_retry = {}
+        self._pending_events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.stats = {"events": 0, "flushes": 0, "hourly_writes": 0, "daily_writes": 0}
+
+    def record(self, user_id: str, campaign_id: str, email_number: int, event: str,
+               count: int = 1, when: datetime = None):
+        """Count an event ("sent", "open", "click" or "conversion")"""
+        if event not in EVENT_FIELDS:
+            raise ValueError(f"Unknown tracking event {event!r}")
+        when = when or datetime.utcnow()
+        hour = when.replace(minute=0, second=0, microsecond=0)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tracking-flush", daemon=True)
+                self._thread.start()
+            self._counts[(user_id, campaign_id, email_number, hour, EVENT_FIELDS[event])] += count
+            self._pending_events += count
+            self.stats["events"] += count
+            full = self._pending_events >= self.flush_events
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write pending counters; returns the number of bucket documents updated"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                self._pending_events = 0
+            hourly, self._hourly_retry = self._hourly_retry, {}
+            daily, self._daily_retry = self._daily_retry, {}
+            if not counts and not hourly and not daily:
+                return 0
+
+            for (user_id, campaign_id, email_number, hour, field), count in counts.items():
+                hourly.setdefault((user_id, campaign_id, email_number, hour), Counter())[field] += count
+                daily.setdefault((user_id, campaign_id, day_start(hour)), Counter())[field] += count
+
+            hourly_keys = list(hourly)
+            hourly_operations = []
+            for user_id, campaign_id, email_number, hour in hourly_keys:
+                hourly_operations.append(UpdateOne(
+                    {"campaign_id": campaign_id, "email_number": email_number, "hour": hour},
+                    {"$inc": dict(hourly[(user_id, campaign_id, email_number, hour)]),
+                     "$setOnInsert": {"user_id": user_id}},
+                    upsert=True
+                ))
+            daily_keys = list(daily)
+            daily_operations = [
+                daily_rollup_operation(user_id, campaign_id, day, daily[(user_id, campaign_id, day)])
+                for user_id, campaign_id, day in daily_keys
+            ]
+            hourly_failed = self._write(self.hourly_collection, hourly_keys, hourly_operations)
+            daily_failed = self._write(self.daily_collection, daily_keys, daily_operations)
+            # Retry what failed on the next flush; see the class docstring
+            # for when a retry can double count
+            self._hourly_retry = {key: hourly[key] for key in hourly_failed}
+            self._daily_retry = {key: daily[key] for key in daily_failed}
+            self.stats["flushes"] += 1
+            self.stats["hourly_writes"] += len(hourly_keys) - len(hourly_failed)
+            self.stats["daily_writes"] += len(daily_keys) - len(daily_failed)
+            return len(hourly_keys) - len(hourly_failed)
+
+    @staticmethod
+    def _write(collection, keys: List, operations: List) -> List:
+        """
+        Unordered bulk write; returns the keys whose operations failed or
+        may have failed
+        """
+        if not operations:
+            return []
+        try:
+            collection.bulk_write(operations, ordered=False)
+            return []
+        except BulkWriteError as e:
+            failed = sorted({error["index"] for error in e.details.get("writeErrors", [])})
+            print(f"Error flushing {len(failed)} of {len(operations)} tracking buckets: {e}")
+            return [keys[index] for index in failed]
+        except Exception as e:
+            # No per-operation result (e.g. the connection dropped after the
+            # server applied part of the batch), so the whole batch is
+            # retried and applied buckets may be incremented twice
+            print(f"Error flushing tracking events: {e}")
+            return keys
+
+    def stop(self):
+        """Flush remaining events and stop the background thread"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+_event_buffer = None
+_event_buffer_lock = threading.Lock()
+
+def get_event_buffer() -> EventBuffer:
+    """Return the process-wide event buffer"""
+    global _event_buffer
+    if _event_buffer is None:
+        with _event_buffer_lock:
+            if _event_buffer is None:
+                from database import campaign_stats_daily, engagement_hourly
+                _event_buffer = EventBuffer(engagement_hourly, campaign_stats_daily)
+                atexit.register(_event_buffer.stop)
+    return _event_buffer
+
+class TrackingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    buffer = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] not in ("o", "c", "v"):
+            return self._respond(404)
+        kind, token = parts
+        if kind == "o" and token.endswith(".gif"):
+            token = token[:-4]
+        target = parse_tracking_token(token)
+
+        if kind == "o":
+            if target:
+                self.buffer.record(**target, event="open")
+            # Always return the pixel so mail clients don't show a broken image
+            return self._respond(200, PIXEL_GIF, "image/gif")
+
+        if kind == "v":
+            if target:
+                self.buffer.record(**target, event="conversion")
+            return self._respond(204 if target else 404)
+
+        query = parse_qs(parsed.query)
+        url = query.get("url", [""])[0]
+        signature = query.get("s", [""])[0]
+        if not target or not url.startswith(("http://", "https://")) \
+                or not hmac.compare_digest(signature, _sign(token + "|" + url)):
+            return self._respond(404)
+        self.buffer.record(**target, event="click")
+        self._respond(302, headers={"Location": url})
+
+    def _respond(self, status: int, body: bytes = b"", content_type: str = "text/plain",
+                 headers: Dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per event is too much at tracking volumes
+        pass
+
+def make_tracking_server(host: str = "127.0.0.1", port: int = 8765,
+                         buffer: EventBuffer = None) -> ThreadingHTTPServer:
+    """Build (but don't start) a tracking server writing to buffer"""
+    handler = type("BoundTrackingHandler", (TrackingHandler,), {"buffer": buffer or get_event_buffer()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local engagement tracking endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = make_tracking_server(args.host, args.port)
+    print(f"Tracking on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        get_event_buffer().stop()
+
+if __name__ == "__main__":
+    main()